@@ -1,58 +1,118 @@
 import numpy as np
+from collections import Counter
 
-def calculate_metrics_from_confusion_matrix(confusion_matrix, class_names):
+def _metrics_from_marginals(tp, row_sums, col_sums, class_names):
+    """
+    Per-class, macro and micro metrics from the diagonal and the marginals
     
-    # Convert to numpy array for easier calculation
-    cm = np.array(confusion_matrix)
-    n_classes = len(class_names)
+    Rows are system predictions and columns the gold standard, so FP comes
+    from the row sums and FN from the column sums. O(K) for K classes.
+    """
+    total = row_sums.sum()
+    fp = row_sums - tp
+    fn = col_sums - tp
+    tn = total - tp - fp - fn
+    precision = np.divide(tp, row_sums, out=np.zeros(len(tp)), where=row_sums > 0)
+    recall = np.divide(tp, col_sums, out=np.zeros(len(tp)), where=col_sums > 0)
     
-    # Calculate per-class metrics
     per_class_metrics = {}
-    
-    for i, class_name in enumerate(class_names):
-        # True Positives: diagonal element
-        tp = cm[i, i]
-        
-        # False Positives: sum of row i excluding diagonal
-        fp = np.sum(cm[i, :]) - tp
-        
-        # False Negatives: sum of column i excluding diagonal  
-        fn = np.sum(cm[:, i]) - tp
-        
-        # True Negatives: everything else
-        tn = np.sum(cm) - tp - fp - fn
-        
-        # Calculate precision and recall
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-        
+    columns = zip(precision.tolist(), recall.tolist(), tp.tolist(), fp.tolist(), fn.tolist(), tn.tolist())
+    for class_name, (p, r, t, f_p, f_n, t_n) in zip(class_names, columns):
         per_class_metrics[class_name] = {
-            'precision': precision,
-            'recall': recall,
-            'tp': tp,
-            'fp': fp,
-            'fn': fn,
-            'tn': tn
+            'precision': p,
+            'recall': r,
+            'tp': t,
+            'fp': f_p,
+            'fn': f_n,
+            'tn': t_n
         }
     
-    # Calculate macro-averaged metrics
-    macro_precision = np.mean([metrics['precision'] for metrics in per_class_metrics.values()])
-    macro_recall = np.mean([metrics['recall'] for metrics in per_class_metrics.values()])
-    
-    # Calculate micro-averaged metrics
-    total_tp = sum([metrics['tp'] for metrics in per_class_metrics.values()])
-    total_fp = sum([metrics['fp'] for metrics in per_class_metrics.values()])
-    total_fn = sum([metrics['fn'] for metrics in per_class_metrics.values()])
-    
-    micro_precision = total_tp / (total_tp + total_fp) if (total_tp + total_fp) > 0 else 0
-    micro_recall = total_tp / (total_tp + total_fn) if (total_tp + total_fn) > 0 else 0
+    # Micro averages: every class's TP + FP (or TP + FN) adds up to the total
+    total_tp = tp.sum()
+    micro_precision = total_tp / total if total > 0 else 0
+    micro_recall = total_tp / col_sums.sum() if col_sums.sum() > 0 else 0
     
     return {
         'per_class': per_class_metrics,
-        'macro': {'precision': macro_precision, 'recall': macro_recall},
+        'macro': {'precision': precision.mean(), 'recall': recall.mean()},
         'micro': {'precision': micro_precision, 'recall': micro_recall}
     }
 
+def calculate_metrics_from_confusion_matrix(confusion_matrix, class_names):
+    """
+    Precision and recall per class plus macro/micro averages
+    
+    Accepts a dense K x K matrix (nested lists/tuples or numpy array) or a
+    sparse matrix with .tocoo() (e.g. scipy.sparse), which goes through
+    calculate_metrics_from_sparse. Pass COO (rows, cols, counts) arrays to
+    calculate_metrics_from_sparse directly.
+    """
+    if hasattr(confusion_matrix, 'tocoo'):
+        return calculate_metrics_from_sparse(confusion_matrix, class_names)
+    
+    cm = np.asarray(confusion_matrix)
+    # Marginals computed once instead of per class
+    return _metrics_from_marginals(np.diagonal(cm).copy(), cm.sum(axis=1), cm.sum(axis=0), class_names)
+
+def calculate_metrics_from_sparse(confusion_matrix, class_names):
+    """
+    Metrics from a sparse confusion matrix in O(nnz + K)
+    
+    Args:
+        confusion_matrix: (rows, cols, counts) COO arrays of class indices,
+            or any object with .tocoo() (row, col and data attributes);
+            duplicate (row, col) entries are summed
+        class_names: Names in index order (see label_index)
+    """
+    if hasattr(confusion_matrix, 'tocoo'):
+        coo = confusion_matrix.tocoo()
+        rows, cols, counts = coo.row, coo.col, coo.data
+    else:
+        rows, cols, counts = confusion_matrix
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    counts = np.asarray(counts)
+    n_classes = len(class_names)
+    if not len(rows) == len(cols) == len(counts):
+        raise ValueError(f"rows, cols and counts differ in length: {len(rows)}, {len(cols)}, {len(counts)}")
+    for name, indices in (('row', rows), ('column', cols)):
+        if len(indices) and (indices.min() < 0 or indices.max() >= n_classes):
+            bad = indices.min() if indices.min() < 0 else indices.max()
+            raise ValueError(f"{name} index {bad} out of range for {n_classes} classes")
+    
+    # Integer counts stay integers; bincount with weights would make them floats
+    dtype = counts.dtype if counts.dtype.kind in 'iu' else float
+    row_sums = np.bincount(rows, weights=counts, minlength=n_classes).astype(dtype)
+    col_sums = np.bincount(cols, weights=counts, minlength=n_classes).astype(dtype)
+    diagonal = rows == cols
+    tp = np.bincount(rows[diagonal], weights=counts[diagonal], minlength=n_classes).astype(dtype)
+    return _metrics_from_marginals(tp, row_sums, col_sums, class_names)
+
+def label_index(class_names):
+    """Map each class name to its row/column index"""
+    return {name: i for i, name in enumerate(class_names)}
+
+def sparse_confusion_matrix(predicted, gold, class_names=None):
+    """
+    Build a COO confusion matrix from parallel lists of predicted and gold labels
+    
+    Labels missing from class_names are appended in order of first
+    appearance. Returns ((rows, cols, counts), class_names).
+    """
+    class_names = list(class_names or [])
+    index = label_index(class_names)
+    pairs = Counter(zip(predicted, gold))
+    rows = np.empty(len(pairs), dtype=np.intp)
+    cols = np.empty(len(pairs), dtype=np.intp)
+    counts = np.empty(len(pairs), dtype=np.int64)
+    for k, ((p, g), count) in enumerate(pairs.items()):
+        for label in (p, g):
+            if label not in index:
+                index[label] = len(class_names)
+                class_names.append(label)
+        rows[k], cols[k], counts[k] = index[p], index[g], count
+    return (rows, cols, counts), class_names
+
 def print_results(results, class_names):
     """Print all results in a clear format"""
     
@@ -76,23 +136,27 @@ def print_results(results, class_names):
     print("Micro averaging: Treats each instance equally (weighted by class frequency)")
     print("Micro-averaging gives more weight to classes with more instances.")
 
-# Define the confusion matrix from the problem
-# Rows: System predictions, Columns: Gold standard
-confusion_matrix = [
-    [5, 10, 5],    # System predicted Cat
-    [15, 20, 10],  # System predicted Dog  
-    [0, 15, 10]    # System predicted Rabbit
-]
+def main():
+    # Define the confusion matrix from the problem
+    # Rows: System predictions, Columns: Gold standard
+    confusion_matrix = [
+        [5, 10, 5],    # System predicted Cat
+        [15, 20, 10],  # System predicted Dog  
+        [0, 15, 10]    # System predicted Rabbit
+    ]
 
-class_names = ['Cat', 'Dog', 'Rabbit']
+    class_names = ['Cat', 'Dog', 'Rabbit']
+
+    print("CONFUSION MATRIX:")
+    print("System \\ Gold    Cat   Dog   Rabbit")
+    print("Cat              5     10    5")
+    print("Dog              15    20    10") 
+    print("Rabbit           0     15    10")
+    print()
 
-print("CONFUSION MATRIX:")
-print("System \\ Gold    Cat   Dog   Rabbit")
-print("Cat              5     10    5")
-print("Dog              15    20    10") 
-print("Rabbit           0     15    10")
-print()
+    # Calculate and print results
+    results = calculate_metrics_from_confusion_matrix(confusion_matrix, class_names)
+    print_results(results, class_names)
 
-# Calculate and print results
-results = calculate_metrics_from_confusion_matrix(confusion_matrix, class_names)
-print_results(results, class_names)
+if __name__ == "__main__":
+    main()
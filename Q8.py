@@ -1,5 +1,9 @@
 from collections import defaultdict, Counter
+from array import array
+from bisect import bisect_left
 import math
+from instrumentation import METRICS
+from vocab import SHARED_POOL
 
 class BigramLanguageModel:
     def __init__(self):
@@ -7,6 +11,7 @@ class BigramLanguageModel:
         self.bigram_counts = defaultdict(Counter)
         self.vocabulary = set()
     
+    @METRICS.timed("lm.train")
     def train(self, corpus):
         """
         Train the bigram language model on a corpus
@@ -39,10 +44,53 @@ class BigramLanguageModel:
     def get_bigram_probability(self, prev_word, word):
         """Calculate bigram probability using MLE"""
         prev_word_count = self.unigram_counts[prev_word]
+        if METRICS.enabled:
+            METRICS.incr("lm.bigram_lookups")
+            if prev_word_count == 0 or word not in self.vocabulary:
+                METRICS.incr("lm.oov_hits")
         if prev_word_count == 0:
             return 0
         return self.bigram_counts[prev_word][word] / prev_word_count
     
+    def get_log_probability(self, prev_word, word, k=0):
+        """
+        Log bigram probability with optional add-k smoothing
+        
+        Returns -inf when the (unsmoothed) probability is zero.
+        """
+        prev_word_count = self.unigram_counts[prev_word]
+        following = self.bigram_counts.get(prev_word)
+        bigram_count = following[word] if following else 0
+        if METRICS.enabled:
+            METRICS.incr("lm.bigram_lookups")
+            if prev_word_count == 0 or word not in self.vocabulary:
+                METRICS.incr("lm.oov_hits")
+        numerator = bigram_count + k
+        denominator = prev_word_count + k * len(self.vocabulary)
+        if numerator == 0 or denominator == 0:
+            return -math.inf
+        return math.log(numerator / denominator)
+    
+    def score_tokens(self, tokens, k=0):
+        """
+        Log probability of a token sequence under the bigram model
+        
+        Args:
+            tokens: List of tokens, including any <s>/</s> markers
+            k: Add-k smoothing constant (0 for plain MLE)
+        """
+        return sum(self.get_log_probability(tokens[i], tokens[i + 1], k)
+                   for i in range(len(tokens) - 1))
+    
+    def score_batch(self, token_lists, k=0):
+        """Log probabilities for a batch of token lists"""
+        return [self.score_tokens(tokens, k) for tokens in token_lists]
+    
+    def freeze(self, pool=None):
+        """Compact integer-id copy of the trained model for scoring (see FrozenBigramModel)"""
+        return FrozenBigramModel(self, pool)
+    
+    @METRICS.timed("lm.sentence_probability")
     def calculate_sentence_probability(self, sentence):
         """
         Calculate the probability of a sentence using the bigram model
@@ -97,6 +145,78 @@ class BigramLanguageModel:
                 prob = self.get_bigram_probability(prev_word, next_word)
                 print(f"P({next_word}|{prev_word}) = {prob:.3f}")
 
+class FrozenBigramModel:
+    """
+    Read-only bigram model working in StringPool ids
+    
+    Unigram counts are an array indexed by word id and bigrams are stored
+    CSR-style: the followers of word i are next_ids[row_starts[i]:row_starts[i + 1]]
+    (sorted, found by binary search) with their counts alongside. No
+    per-word strings or dicts are kept, and scoring already-interned ids
+    never hashes a string.
+    """
+    
+    def __init__(self, model, pool=None):
+        self.pool = SHARED_POOL if pool is None else pool
+        self.vocabulary_size = len(model.vocabulary)
+        ids = {word: self.pool.intern(word) for word in model.vocabulary}
+        size = len(self.pool)
+        self.unigram_counts = array('Q', [0]) * size
+        for word, count in model.unigram_counts.items():
+            self.unigram_counts[ids[word]] = count
+        followers = [None] * size
+        for prev_word, following in model.bigram_counts.items():
+            if following:
+                followers[ids[prev_word]] = sorted((ids[word], count) for word, count in following.items())
+        self.row_starts = array('Q', [0])
+        self.next_ids = array('I')
+        self.counts = array('Q')
+        for row in followers:
+            for word_id, count in row or ():
+                self.next_ids.append(word_id)
+                self.counts.append(count)
+            self.row_starts.append(len(self.next_ids))
+    
+    def word_ids(self, tokens):
+        """Pool ids for tokens; words the pool has never seen get -1"""
+        return self.pool.lookup_many(tokens)
+    
+    def bigram_count(self, prev_id, word_id):
+        if not 0 <= prev_id < len(self.unigram_counts):
+            return 0
+        start, end = self.row_starts[prev_id], self.row_starts[prev_id + 1]
+        i = bisect_left(self.next_ids, word_id, start, end)
+        return self.counts[i] if i < end and self.next_ids[i] == word_id else 0
+    
+    def log_probability_ids(self, prev_id, word_id, k=0):
+        """get_log_probability for word ids"""
+        prev_word_count = self.unigram_counts[prev_id] if 0 <= prev_id < len(self.unigram_counts) else 0
+        if METRICS.enabled:
+            METRICS.incr("lm.bigram_lookups")
+            if prev_word_count == 0 or not 0 <= word_id < len(self.unigram_counts) \
+                    or self.unigram_counts[word_id] == 0:
+                METRICS.incr("lm.oov_hits")
+        numerator = self.bigram_count(prev_id, word_id) + k
+        denominator = prev_word_count + k * self.vocabulary_size
+        if numerator == 0 or denominator == 0:
+            return -math.inf
+        return math.log(numerator / denominator)
+    
+    def get_log_probability(self, prev_word, word, k=0):
+        """Same result as BigramLanguageModel.get_log_probability"""
+        return self.log_probability_ids(self.pool.get(prev_word, -1), self.pool.get(word, -1), k)
+    
+    def score_ids(self, ids, k=0):
+        """Log probability of a sequence of word ids"""
+        return sum(self.log_probability_ids(ids[i], ids[i + 1], k) for i in range(len(ids) - 1))
+    
+    def score_tokens(self, tokens, k=0):
+        return self.score_ids(self.word_ids(tokens), k)
+    
+    def score_batch(self, token_lists, k=0):
+        """Log probabilities for a batch of token lists"""
+        return [self.score_tokens(tokens, k) for tokens in token_lists]
+
 def main():
     # Training corpus from the problem
     training_corpus = [
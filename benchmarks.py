@@ -0,0 +1,391 @@
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime, timezone
+from instrumentation import METRICS
+
+# Synthetic data sizes for each scale; benchmarks scale linearly with these
+SCALES = {
+    'small': {'words': 20000, 'vocab': 2000, 'merges': 50, 'pairs': 300,
+              'sentences': 2000, 'lines': 2000, 'classes': 50},
+    'medium': {'words': 100000, 'vocab': 10000, 'merges': 200, 'pairs': 1500,
+               'sentences': 10000, 'lines': 10000, 'classes': 200},
+    'large': {'words': 500000, 'vocab': 50000, 'merges': 500, 'pairs': 6000,
+              'sentences': 50000, 'lines': 50000, 'classes': 1000},
+}
+
+SYLLABLES = ["ka", "lo", "ne", "wer", "st", "in", "ing", "tion", "re", "un",
+             "pro", "ed", "er", "al", "ly", "mi", "sa", "to", "de", "co"]
+
+# Synthetic corpus generators
+
+def synthetic_vocabulary(size, seed=0):
+    """Pseudo-words built from common English syllables"""
+    rng = random.Random(seed)
+    vocab = set()
+    while len(vocab) < size:
+        vocab.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(vocab)
+
+def synthetic_words(n_words, vocab_size, seed=0):
+    """Zipf-distributed word stream over a synthetic vocabulary"""
+    vocab = synthetic_vocabulary(vocab_size, seed)
+    rng = random.Random(seed + 1)
+    weights = [1.0 / rank for rank in range(1, len(vocab) + 1)]
+    return rng.choices(vocab, weights=weights, k=n_words)
+
+def synthetic_sentences(n_sentences, vocab_size, seed=0, min_len=5, max_len=20):
+    """Sentences wrapped in <s> ... </s> like the Q8 training corpus"""
+    rng = random.Random(seed + 2)
+    lengths = [rng.randint(min_len, max_len) for _ in range(n_sentences)]
+    words = iter(synthetic_words(sum(lengths), vocab_size, seed))
+    return ["<s> " + ' '.join(next(words) for _ in range(n)) + " </s>" for n in lengths]
+
+def synthetic_paragraphs(n_sentences, vocab_size, seed=0):
+    """Prose with contractions and punctuation for the tokenizers"""
+    rng = random.Random(seed + 3)
+    extras = ["weren't", "they've", "couldn't", "it's", "we'd", "won't", "U.S.", "mind-boggling"]
+    sentences = []
+    for sentence in synthetic_sentences(n_sentences, vocab_size, seed):
+        words = sentence.split()[1:-1]
+        words[rng.randrange(len(words))] = rng.choice(extras)
+        if rng.random() < 0.3:
+            words[len(words) // 2] += ','
+        sentences.append(' '.join(words).capitalize() + rng.choice('.!?'))
+    return ' '.join(sentences)
+
+def synthetic_regex_text(n_lines, seed=0):
+    """Lines mixing dates, URLs, emails, currency and phone numbers"""
+    rng = random.Random(seed + 4)
+    templates = [
+        "The offer ends on {m}/{d}/20{y} for all users.",
+        "Visit https://www.example{n}.com/page-{n} for details.",
+        "Send feedback to user{n}@example.org today.",
+        "Plans start at ${n}.{c} per month.",
+        "Call us at 800-555-{p} any day.",
+        "Our team has a new designer and a project lead.",
+    ]
+    lines = []
+    for _ in range(n_lines):
+        lines.append(rng.choice(templates).format(
+            m=rng.randint(1, 12), d=rng.randint(1, 28), y=rng.randint(10, 30),
+            n=rng.randint(1, 9999), c=rng.randint(10, 99), p=rng.randint(1000, 9999)))
+    return '\n'.join(lines)
+
+def synthetic_word_pairs(n_pairs, vocab_size, seed=0):
+    """Word pairs for edit distance, half of them near-misses"""
+    rng = random.Random(seed + 5)
+    words = synthetic_words(n_pairs * 2, vocab_size, seed)
+    pairs = []
+    for i in range(n_pairs):
+        a, b = words[2 * i], words[2 * i + 1]
+        if i % 2 == 0:
+            position = rng.randrange(len(a))
+            b = a[:position] + rng.choice('aeiou') + a[position + 1:]
+        pairs.append((a, b))
+    return pairs
+
+def synthetic_confusion_matrix(n_classes, seed=0, total=100000):
+    """Diagonal-heavy confusion matrix with n_classes classes"""
+    rng = random.Random(seed + 6)
+    matrix = [[0] * n_classes for _ in range(n_classes)]
+    for _ in range(total):
+        gold = rng.randrange(n_classes)
+        predicted = gold if rng.random() < 0.7 else rng.randrange(n_classes)
+        matrix[predicted][gold] += 1
+    return matrix
+
+# Benchmarks: each returns (seconds, items processed) for one run
+
+# Peak bytes allocated by the last timed call, set only while tracemalloc is tracing
+last_peak_bytes = None
+
+def _timed(fn, *args):
+    global last_peak_bytes
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # Measure the timed call only, not the benchmark's setup
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    if tracing:
+        last_peak_bytes = tracemalloc.get_traced_memory()[1] - baseline
+    return elapsed
+
+def bench_bpe_train(sizes, seed):
+    from q3 import BPELearner
+    corpus = ' '.join(synthetic_words(sizes['words'], sizes['vocab'], seed))
+    learner = BPELearner()
+    return _timed(learner.train, corpus, sizes['merges'], False), sizes['merges']
+
+def bench_bpe_encode(sizes, seed):
+    from q3 import BPELearner
+    learner = BPELearner()
+    learner.train(' '.join(synthetic_words(sizes['words'] // 10, sizes['vocab'], seed)),
+                  sizes['merges'], verbose=False)
+    words = synthetic_words(sizes['words'] // 10, sizes['vocab'], seed + 7)
+
+    def encode():
+        for word in words:
+            learner.segment_word(word)
+    return _timed(encode), len(words)
+
+def _trained_byte_bpe(sizes, seed):
+    from q3 import ByteBPE
+    bpe = ByteBPE()
+    bpe.train_from_data(' '.join(synthetic_words(sizes['words'], sizes['vocab'], seed)), sizes['merges'] * 4)
+    return bpe, ' '.join(synthetic_words(sizes['words'] // 10, sizes['vocab'], seed + 7)).encode()
+
+def bench_byte_bpe_encode(sizes, seed):
+    bpe, data = _trained_byte_bpe(sizes, seed)
+    bpe.cache.clear()
+    return _timed(bpe.encode, data), len(data)
+
+def bench_bpe_dropout(sizes, seed):
+    bpe, data = _trained_byte_bpe(sizes, seed)
+    return _timed(bpe.sample_encode, data, 0.1, random.Random(seed)), len(data)
+
+def bench_edit_distance(sizes, seed):
+    from q4 import edit_distance
+    pairs = synthetic_word_pairs(sizes['pairs'], sizes['vocab'], seed)
+
+    def run():
+        for a, b in pairs:
+            edit_distance(a, b)
+    return _timed(run), len(pairs)
+
+def bench_weighted_edit_distance(sizes, seed):
+    from q4 import weighted_edit_distance, keyboard_cost_tables
+    pairs = synthetic_word_pairs(sizes['pairs'], sizes['vocab'], seed)
+    alphabet, sub, ins, dele = keyboard_cost_tables()
+
+    def run():
+        for a, b in pairs:
+            weighted_edit_distance(a, b, sub, ins, dele, alphabet)
+    return _timed(run), len(pairs)
+
+def bench_incremental_edit_distance(sizes, seed):
+    from q4 import IncrementalEditDistance
+    targets = synthetic_vocabulary(sizes['vocab'], seed)
+    queries = synthetic_words(sizes['pairs'] // 10, sizes['vocab'], seed + 9)
+
+    def run():
+        # Type each query one keystroke at a time against every target
+        search = IncrementalEditDistance(targets)
+        for query in queries:
+            search.set_query("")
+            for char in query:
+                search.push(char)
+                search.matches(2)
+    return _timed(run), sum(len(query) for query in queries)
+
+def bench_bigram_train(sizes, seed):
+    from Q8 import BigramLanguageModel
+    corpus = synthetic_sentences(sizes['sentences'], sizes['vocab'], seed)
+    return _timed(BigramLanguageModel().train, corpus), len(corpus)
+
+def bench_bigram_score(sizes, seed):
+    from Q8 import BigramLanguageModel
+    model = BigramLanguageModel()
+    model.train(synthetic_sentences(sizes['sentences'], sizes['vocab'], seed))
+    sentences = synthetic_sentences(sizes['sentences'] // 10, sizes['vocab'], seed + 8)
+
+    def score():
+        for sentence in sentences:
+            model.calculate_sentence_probability(sentence)
+    return _timed(score), len(sentences)
+
+def bench_bigram_score_ids(sizes, seed):
+    from Q8 import BigramLanguageModel
+    from vocab import StringPool
+    model = BigramLanguageModel()
+    model.train(synthetic_sentences(sizes['sentences'], sizes['vocab'], seed))
+    frozen = model.freeze(StringPool())
+    sentences = [frozen.word_ids(sentence.split())
+                 for sentence in synthetic_sentences(sizes['sentences'] // 10, sizes['vocab'], seed + 8)]
+
+    def score():
+        for ids in sentences:
+            frozen.score_ids(ids, 1)
+    return _timed(score), len(sentences)
+
+def bench_spell_correct(sizes, seed):
+    from Q8 import BigramLanguageModel
+    from spell import SpellCorrector, corrupt
+    sentences = synthetic_sentences(sizes['sentences'] + sizes['pairs'], sizes['vocab'], seed)
+    model = BigramLanguageModel()
+    model.train(sentences[:sizes['sentences']])
+    rng = random.Random(seed)
+    noisy = [[corrupt(t, rng) if rng.random() < 0.15 else t for t in sentence.split()[1:-1]]
+             for sentence in sentences[sizes['sentences']:]]
+
+    def run():
+        # Fresh caches every repeat so cache warm-up is part of the timing
+        SpellCorrector(model).correct_batch(noisy)
+    return _timed(run), len(noisy)
+
+def bench_tokenize_naive(sizes, seed):
+    from q2 import naive_tokenization
+    text = synthetic_paragraphs(sizes['sentences'], sizes['vocab'], seed)
+    return _timed(naive_tokenization, text), len(text)
+
+def bench_tokenize_manual(sizes, seed):
+    from q2 import manual_tokenization
+    text = synthetic_paragraphs(sizes['sentences'], sizes['vocab'], seed)
+    return _timed(manual_tokenization, text), len(text)
+
+def bench_tokenize_spans(sizes, seed):
+    from q2 import manual_token_spans
+    text = synthetic_paragraphs(sizes['sentences'], sizes['vocab'], seed)
+    return _timed(manual_token_spans, text), len(text)
+
+def bench_regex_extract(sizes, seed):
+    from q1 import extract_all
+    text = synthetic_regex_text(sizes['lines'], seed)
+    return _timed(extract_all, text), len(text)
+
+def bench_metrics(sizes, seed):
+    from Q5 import calculate_metrics_from_confusion_matrix
+    n_classes = sizes['classes']
+    matrix = synthetic_confusion_matrix(n_classes, seed)
+    names = [f"class{i}" for i in range(n_classes)]
+    return _timed(calculate_metrics_from_confusion_matrix, matrix, names), n_classes
+
+def bench_metrics_sparse(sizes, seed):
+    from Q5 import calculate_metrics_from_sparse
+    import numpy as np
+    # 100x the dense class count, ~10 non-zero cells per class, mostly diagonal
+    n_classes = sizes['classes'] * 100
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, n_classes, n_classes * 10)
+    cols = np.where(rng.random(len(rows)) < 0.7, rows, rng.integers(0, n_classes, len(rows)))
+    counts = rng.integers(1, 20, len(rows))
+    names = [f"class{i}" for i in range(n_classes)]
+    return _timed(calculate_metrics_from_sparse, (rows, cols, counts), names), n_classes
+
+BENCHMARKS = {
+    'bpe_train': bench_bpe_train,
+    'bpe_encode': bench_bpe_encode,
+    'byte_bpe_encode': bench_byte_bpe_encode,
+    'bpe_dropout': bench_bpe_dropout,
+    'edit_distance': bench_edit_distance,
+    'weighted_edit_distance': bench_weighted_edit_distance,
+    'incremental_edit_distance': bench_incremental_edit_distance,
+    'bigram_train': bench_bigram_train,
+    'bigram_score': bench_bigram_score,
+    'bigram_score_ids': bench_bigram_score_ids,
+    'spell_correct': bench_spell_correct,
+    'tokenize_naive': bench_tokenize_naive,
+    'tokenize_manual': bench_tokenize_manual,
+    'tokenize_spans': bench_tokenize_spans,
+    'regex_extract': bench_regex_extract,
+    'metrics': bench_metrics,
+    'metrics_sparse': bench_metrics_sparse,
+}
+
+def run_benchmarks(scale='small', names=None, repeat=3, seed=0):
+    """
+    Run the selected benchmarks and return a JSON-serializable result dict.
+
+    Each benchmark is run `repeat` times on the same synthetic input and the
+    fastest run is reported, which is the least noisy estimate.
+    """
+    sizes = SCALES[scale]
+    results = {}
+    for name in names or BENCHMARKS:
+        runs = [BENCHMARKS[name](sizes, seed) for _ in range(repeat)]
+        seconds = min(elapsed for elapsed, _ in runs)
+        items = runs[0][1]
+        results[name] = {
+            'seconds': seconds,
+            'items': items,
+            'items_per_sec': items / seconds if seconds > 0 else float('inf'),
+        }
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': scale,
+            'sizes': sizes,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+def compare_results(current, previous, threshold=0.10):
+    """
+    Compare two result dicts benchmark by benchmark.
+
+    Returns rows of (name, previous seconds, current seconds, ratio, regressed)
+    where regressed means current is more than `threshold` slower.
+    """
+    rows = []
+    for name, stats in current['results'].items():
+        if name not in previous['results']:
+            continue
+        before = previous['results'][name]['seconds']
+        ratio = stats['seconds'] / before if before > 0 else float('inf')
+        rows.append((name, before, stats['seconds'], ratio, ratio > 1 + threshold))
+    return rows
+
+def print_results(results):
+    """Print a result dict as a table"""
+    meta = results['meta']
+    print(f"BENCHMARKS (scale={meta['scale']}, repeat={meta['repeat']}, seed={meta['seed']})")
+    print("-" * 68)
+    print(f"{'Benchmark':<26} {'Seconds':>10} {'Items':>10} {'Items/s':>14}")
+    for name, stats in results['results'].items():
+        print(f"{name:<26} {stats['seconds']:>10.4f} {stats['items']:>10d} {stats['items_per_sec']:>14.1f}")
+
+def print_comparison(rows):
+    """Print the output of compare_results"""
+    print("\nCOMPARISON WITH PREVIOUS RUN:")
+    print("-" * 68)
+    print(f"{'Benchmark':<26} {'Before':>10} {'After':>10} {'Ratio':>8}")
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<26} {before:>10.4f} {after:>10.4f} {ratio:>8.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the homework NLP components")
+    parser.add_argument("--scale", choices=sorted(SCALES), default='small')
+    parser.add_argument("--only", nargs='+', choices=sorted(BENCHMARKS),
+                        help="run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown ratio above which a benchmark is flagged")
+    parser.add_argument("--metrics", action="store_true",
+                        help="enable instrumentation and print its counters (adds overhead)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        METRICS.enable()
+    results = run_benchmarks(args.scale, args.only, args.repeat, args.seed)
+    print_results(results)
+
+    if args.metrics:
+        print("\nINSTRUMENTATION (Prometheus text format):")
+        print(METRICS.to_prometheus(), end="")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print_comparison(compare_results(results, previous, args.threshold))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import os
+import json
+import mmap
+import time
+import pickle
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from q3 import ByteBPE
+
+# Token id dtypes: (numpy-style name, array typecode)
+DTYPES = {2: ('uint16', 'H'), 4: ('uint32', 'I')}
+
+def token_dtype(vocab_size):
+    """Smallest unsigned dtype that can hold every token id"""
+    itemsize = 2 if vocab_size <= 1 << 16 else 4
+    name, typecode = DTYPES[itemsize]
+    return name, typecode, itemsize
+
+def shard_boundaries(path, n_shards):
+    """Split a file into byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        starts = [0]
+        for k in range(1, n_shards):
+            newline = mm.find(b'\n', max(starts[-1], k * size // n_shards))
+            if newline == -1 or newline + 1 >= size:
+                break
+            if newline + 1 > starts[-1]:
+                starts.append(newline + 1)
+    return list(zip(starts, starts[1:] + [size]))
+
+# Worker state, installed once per process by the pool initializer
+_bpe = None
+
+def _init_worker(bpe):
+    global _bpe
+    _bpe = bpe
+
+def _encode_shard(input_path, output_path, start, end, region, typecode):
+    """
+    Encode documents (lines) in input[start:end] into output at byte offset region.
+
+    Byte-level BPE never produces more tokens than input bytes, so the
+    shard's region is sized from its byte length and can be written without
+    knowing the other shards' token counts. Returns the per-document token
+    counts.
+    """
+    lengths = array('Q')
+    itemsize = array(typecode).itemsize
+    with open(input_path, 'rb') as fin, mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as src, \
+            open(output_path, 'r+b') as fout, mmap.mmap(fout.fileno(), 0) as dst:
+        view = memoryview(src)
+        position = region
+        line_start = start
+        while line_start < end:
+            line_end = src.find(b'\n', line_start, end)
+            if line_end == -1:
+                line_end = end
+            ids = array(typecode, _bpe.encode(view[line_start:line_end]))
+            nbytes = len(ids) * itemsize
+            dst[position:position + nbytes] = memoryview(ids).cast('B')
+            position += nbytes
+            lengths.append(len(ids))
+            line_start = line_end + 1
+        view.release()
+    return lengths
+
+def encode_corpus(bpe, input_path, output_path, workers=None, shards_per_worker=4):
+    """
+    Encode a one-document-per-line file into a flat token id file.
+
+    Writes output_path (token ids, uint16 or uint32), output_path + ".idx"
+    (uint64 document offsets, n_docs + 1 entries) and output_path + ".json"
+    (dtype and sizes). Shards are encoded in parallel straight into a
+    memory-mapped output file and compacted in place afterwards.
+    """
+    workers = workers or os.cpu_count() or 1
+    dtype, typecode, itemsize = token_dtype(len(bpe.vocab))
+    shards = shard_boundaries(input_path, workers * shards_per_worker)
+
+    # Each shard gets an upper-bound region of (bytes * itemsize)
+    regions = []
+    total = 0
+    for start, end in shards:
+        regions.append(total)
+        total += (end - start) * itemsize
+    with open(output_path, 'wb') as f:
+        f.truncate(max(total, 1))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(bpe,)) as pool:
+        futures = [pool.submit(_encode_shard, input_path, output_path, start, end, region, typecode)
+                   for (start, end), region in zip(shards, regions)]
+        shard_lengths = [future.result() for future in futures]
+
+    # Compact shard regions to be contiguous and build the offsets index
+    offsets = array('Q', [0])
+    n_tokens = 0
+    with open(output_path, 'r+b') as f:
+        with mmap.mmap(f.fileno(), 0) as mm:
+            for region, lengths in zip(regions, shard_lengths):
+                shard_tokens = sum(lengths)
+                if region != n_tokens * itemsize and shard_tokens:
+                    mm.move(n_tokens * itemsize, region, shard_tokens * itemsize)
+                for length in lengths:
+                    offsets.append(offsets[-1] + length)
+                n_tokens += shard_tokens
+            mm.flush()
+        f.truncate(n_tokens * itemsize)
+
+    with open(output_path + '.idx', 'wb') as f:
+        offsets.tofile(f)
+    meta = {'dtype': dtype, 'n_docs': len(offsets) - 1, 'n_tokens': n_tokens,
+            'vocab_size': len(bpe.vocab)}
+    with open(output_path + '.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+class TokenCorpus:
+    """
+    Zero-copy reader for files written by encode_corpus.
+
+    corpus[i] is a memoryview of document i's token ids backed by the
+    memory-mapped file; nothing is copied until the caller does so.
+    """
+
+    def __init__(self, path):
+        with open(path + '.json') as f:
+            self.meta = json.load(f)
+        typecode = {name: code for name, code in DTYPES.values()}[self.meta['dtype']]
+        self._files = []
+        self.tokens = self._map(path, typecode) if self.meta['n_tokens'] else memoryview(array(typecode))
+        self.offsets = self._map(path + '.idx', 'Q')
+
+    def _map(self, path, typecode):
+        f = open(path, 'rb')
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files.append((f, mm))
+        return memoryview(mm).cast(typecode)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def close(self):
+        self.tokens.release()
+        self.offsets.release()
+        for f, mm in self._files:
+            mm.close()
+            f.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode a corpus (one document per line) to token ids")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--model", help="pickled ByteBPE model (trained on the input if omitted)")
+    parser.add_argument("--save-model", help="write the trained model here")
+    parser.add_argument("--merges", type=int, default=1000)
+    parser.add_argument("--train-bytes", type=int, default=10_000_000,
+                        help="train on this many leading bytes of the input")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.model:
+        with open(args.model, 'rb') as f:
+            bpe = pickle.load(f)
+    else:
+        bpe = ByteBPE()
+        with open(args.input, 'rb') as f:
+            bpe.train_from_data(f.read(args.train_bytes), args.merges)
+        if args.save_model:
+            with open(args.save_model, 'wb') as f:
+                pickle.dump(bpe, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    start = time.perf_counter()
+    meta = encode_corpus(bpe, args.input, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(args.input)
+    print(f"Encoded {meta['n_docs']} documents, {meta['n_tokens']} tokens ({meta['dtype']}) "
+          f"in {elapsed:.2f}s ({size / elapsed / 1e6:.1f} MB/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import re
+import time
+import threading
+import functools
+from collections import defaultdict
+
+class _NullTimer:
+    """Context manager that does nothing, returned while metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """
+    Opt-in counters and timers for the NLP hot paths.
+
+    Everything is a no-op until enable() is called (or NLP_METRICS=1 is set),
+    and hot call sites check `METRICS.enabled` before doing any work, so the
+    disabled cost is a single attribute lookup. Names are dotted strings such
+    as "bpe.merges_applied" or "edit_distance.dp_cells".
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(lambda: [0, 0.0])  # name -> [count, total seconds]
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def incr(self, name, value=1):
+        """Add value to a counter"""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def observe(self, name, seconds):
+        """Record one timed call"""
+        with self._lock:
+            timer = self.timers[name]
+            timer[0] += 1
+            timer[1] += seconds
+
+    def timer(self, name):
+        """Context manager timing its block under name"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function under name"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def to_dict(self):
+        """Snapshot of all counters and timers"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {
+                    name: {'count': count, 'total_seconds': total,
+                           'mean_seconds': total / count if count else 0.0}
+                    for name, (count, total) in self.timers.items()
+                },
+            }
+
+    def to_prometheus(self, prefix="nlp_"):
+        """Render counters and timers in the Prometheus text exposition format"""
+        def metric_name(name):
+            return prefix + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+        snapshot = self.to_dict()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            full_name = metric_name(name) + "_total"
+            lines.append(f"# TYPE {full_name} counter")
+            lines.append(f"{full_name} {value}")
+        for name, stats in sorted(snapshot['timers'].items()):
+            full_name = metric_name(name) + "_seconds"
+            lines.append(f"# TYPE {full_name} summary")
+            lines.append(f"{full_name}_count {stats['count']}")
+            lines.append(f"{full_name}_sum {stats['total_seconds']:.9f}")
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry used by q3.py, q4.py and Q8.py
+METRICS = Metrics(enabled=os.environ.get("NLP_METRICS", "") not in ("", "0"))
@@ -0,0 +1,200 @@
+import sys
+import json
+import argparse
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+
+import benchmarks
+
+# Fixed benchmark set over q3.py (BPE), q4.py (edit distance) and Q8.py (bigram LM).
+# Sizes and seed are pinned here rather than taken from benchmarks.SCALES so
+# that retuning the scales never silently invalidates the baseline.
+GATE_BENCHMARKS = [
+    'bpe_train', 'bpe_encode', 'byte_bpe_encode', 'bpe_dropout',
+    'edit_distance', 'weighted_edit_distance', 'incremental_edit_distance',
+    'bigram_train', 'bigram_score',
+]
+GATE_SIZES = {'words': 20000, 'vocab': 2000, 'merges': 50, 'pairs': 300,
+              'sentences': 2000, 'lines': 2000, 'classes': 50}
+GATE_SEED = 0
+DEFAULT_BASELINE = "perf_baseline.json"
+
+def measure(name, repeat=5, sizes=GATE_SIZES, seed=GATE_SEED):
+    """
+    Time one benchmark `repeat` times (after a discarded warm-up run) and
+    measure its peak memory in a separate run under tracemalloc, which
+    would otherwise distort the timings.
+    """
+    bench = benchmarks.BENCHMARKS[name]
+    bench(sizes, seed)
+    times = [bench(sizes, seed)[0] for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        _, items = bench(sizes, seed)
+        peak = benchmarks.last_peak_bytes
+    finally:
+        tracemalloc.stop()
+    return {
+        'median_seconds': statistics.median(times),
+        'stdev_seconds': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'min_seconds': min(times),
+        'runs': times,
+        'items': items,
+        'peak_bytes': peak,
+    }
+
+def run_gate(names=None, repeat=5):
+    """Run the gate benchmarks and return a JSON-serializable result dict"""
+    results = {}
+    for name in names or GATE_BENCHMARKS:
+        results[name] = measure(name, repeat)
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'sizes': GATE_SIZES,
+            'seed': GATE_SEED,
+            'repeat': repeat,
+            'note': "Timings are machine-specific; re-record with --write-baseline on new hardware.",
+        },
+        'results': results,
+    }
+
+def _check(stats, before, threshold, memory_threshold, min_delta, min_bytes):
+    """(time ratio, memory ratio, regressed) for one benchmark against its baseline"""
+    time_ratio = (stats['median_seconds'] / before['median_seconds']
+                  if before['median_seconds'] > 0 else float('inf'))
+    memory_ratio = (stats['peak_bytes'] / before['peak_bytes']
+                    if before['peak_bytes'] > 0 else 1.0)
+    # Medians alone are noisy between processes, so the fastest run must be
+    # slower by the same margin; confirm() re-measures before failing
+    slower = (time_ratio > 1 + threshold
+              and stats['median_seconds'] - before['median_seconds'] > min_delta
+              and stats['min_seconds'] > before['min_seconds'] * (1 + threshold))
+    # The byte floor scales with the baseline peak so tiny peaks can still fail
+    bigger = (memory_ratio > 1 + memory_threshold
+              and stats['peak_bytes'] - before['peak_bytes'] > max(min_bytes, 0.1 * before['peak_bytes']))
+    return time_ratio, memory_ratio, slower or bigger
+
+def compare(current, baseline, threshold=0.25, memory_threshold=0.25, min_delta=0.001,
+            min_bytes=1024):
+    """
+    Compare gate results against a baseline.
+
+    A benchmark regresses when both its median and its fastest run are
+    more than `threshold` slower than the baseline's (and the median by
+    more than min_delta seconds), or when its peak memory is more than
+    `memory_threshold` larger and grew by more than max(min_bytes, 10% of
+    the baseline peak). Returns rows of
+    (name, before s, after s, time ratio, before bytes, after bytes, memory ratio, regressed).
+    """
+    rows = []
+    for name, stats in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        time_ratio, memory_ratio, regressed = _check(stats, before, threshold, memory_threshold,
+                                                     min_delta, min_bytes)
+        rows.append((name, before['median_seconds'], stats['median_seconds'], time_ratio,
+                     before['peak_bytes'], stats['peak_bytes'], memory_ratio, regressed))
+    return rows
+
+def confirm(rows, baseline, repeat=5, retries=3, **thresholds):
+    """
+    Re-measure every regressed benchmark up to `retries` times; it stays a
+    regression only if it regresses on every attempt
+    """
+    confirmed = []
+    for row in rows:
+        name, regressed = row[0], row[-1]
+        for _ in range(retries if regressed else 0):
+            stats = measure(name, repeat)
+            before = baseline['results'][name]
+            time_ratio, memory_ratio, regressed = _check(stats, before, **thresholds)
+            row = (name, before['median_seconds'], stats['median_seconds'], time_ratio,
+                   before['peak_bytes'], stats['peak_bytes'], memory_ratio, regressed)
+            if not regressed:
+                break
+        confirmed.append(row)
+    return confirmed
+
+def print_results(results):
+    meta = results['meta']
+    print(f"PERF GATE (repeat={meta['repeat']}, seed={meta['seed']})")
+    print("-" * 64)
+    print(f"{'Benchmark':<26} {'Median s':>10} {'Stdev %':>8} {'Items':>7} {'Peak KiB':>10}")
+    for name, stats in results['results'].items():
+        spread = 100 * stats['stdev_seconds'] / stats['median_seconds'] if stats['median_seconds'] else 0.0
+        print(f"{name:<26} {stats['median_seconds']:>10.4f} {spread:>8.1f} "
+              f"{stats['items']:>7d} {stats['peak_bytes'] / 1024:>10.1f}")
+
+def print_comparison(rows):
+    print("\nCOMPARISON WITH BASELINE:")
+    print("-" * 64)
+    print(f"{'Benchmark':<26} {'Time x':>8} {'Memory x':>9}")
+    for name, _, _, time_ratio, _, _, memory_ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<26} {time_ratio:>8.2f} {memory_ratio:>9.2f}{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when BPE / edit distance / LM performance regresses")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--write-baseline", action="store_true",
+                        help="record the current results as the new baseline instead of comparing")
+    parser.add_argument("--only", nargs='+', choices=GATE_BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed median slowdown, e.g. 0.25 = 25%%")
+    parser.add_argument("--memory-threshold", type=float, default=0.25,
+                        help="allowed peak-memory growth")
+    parser.add_argument("--min-delta", type=float, default=0.001,
+                        help="ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--min-memory-delta", type=int, default=1024,
+                        help="ignore peak-memory growth smaller than this many bytes "
+                             "(or 10%% of the baseline peak, if larger)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="re-measure a regressed benchmark this many times before failing it")
+    parser.add_argument("--output", help="also write the current results to this JSON file")
+    args = parser.parse_args()
+
+    if not args.write_baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}; record one with --write-baseline")
+            sys.exit(2)
+        if baseline['meta']['sizes'] != GATE_SIZES or baseline['meta']['seed'] != GATE_SEED:
+            print("Baseline was recorded with different sizes or seed; re-record it with --write-baseline")
+            sys.exit(2)
+
+    results = run_gate(args.only, args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.write_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    thresholds = {'threshold': args.threshold, 'memory_threshold': args.memory_threshold,
+                  'min_delta': args.min_delta, 'min_bytes': args.min_memory_delta}
+    rows = compare(results, baseline, **thresholds)
+    rows = confirm(rows, baseline, args.repeat, args.retries, **thresholds)
+    print_comparison(rows)
+    regressions = [row[0] for row in rows if row[-1]]
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nPASSED")
+
+if __name__ == "__main__":
+    main()
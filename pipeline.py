@@ -0,0 +1,328 @@
+import time
+import queue
+import argparse
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from q2 import manual_tokenization
+from q3 import BPELearner
+from Q8 import BigramLanguageModel
+from instrumentation import METRICS
+
+_END = object()
+
+def _apply_batch(fn, batch):
+    """Apply a stage function to every item of a batch"""
+    return [fn(item) for item in batch]
+
+# Each process-pool worker serves a single stage; its function is sent once
+# through the pool initializer instead of being pickled with every batch.
+_worker_fn = None
+
+def _install_worker_fn(fn):
+    global _worker_fn
+    _worker_fn = fn
+
+def _apply_worker_batch(batch):
+    return [_worker_fn(item) for item in batch]
+
+class Stage:
+    """
+    One step of a Pipeline.
+
+    fn maps a single item to a single result. With executor="thread" or
+    "process", batches are handed to a pool of `workers`; fn (and anything it
+    references) must then be picklable for the process pool.
+    """
+
+    def __init__(self, name, fn, executor=None, workers=1):
+        if executor not in (None, "thread", "process"):
+            raise ValueError(f"Unknown executor: {executor}")
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.workers = workers
+
+    def make_pool(self):
+        if self.executor == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers)
+        if self.executor == "process":
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=_install_worker_fn,
+                                       initargs=(self.fn,))
+        return None
+
+    def submit(self, pool, batch):
+        if self.executor == "process":
+            return pool.submit(_apply_worker_batch, batch)
+        return pool.submit(_apply_batch, self.fn, batch)
+
+class StageStats:
+    """Throughput and queue wait times for one stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0   # starved: upstream had nothing ready
+        self.output_wait_seconds = 0.0  # backpressure: downstream queue was full
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        wall = (self.finished or time.perf_counter()) - self.started if self.started else 0.0
+        return {
+            'items': self.items,
+            'batches': self.batches,
+            'busy_seconds': self.busy_seconds,
+            'input_wait_seconds': self.input_wait_seconds,
+            'output_wait_seconds': self.output_wait_seconds,
+            'wall_seconds': wall,
+            'items_per_sec': self.items / wall if wall > 0 else 0.0,
+        }
+
+class Pipeline:
+    """
+    Lazy, generator-based chain of stages connected by bounded queues.
+
+    Items flow between stages in batches of `batch_size`; each queue holds at
+    most `queue_size` batches, so memory stays constant however long the
+    input stream is. A slow stage makes upstream stages block on put, which
+    shows up as output_wait_seconds in stats().
+    """
+
+    def __init__(self, stages, batch_size=64, queue_size=4):
+        self.stages = stages
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self._reset()
+
+    def _reset(self):
+        self.source_stats = StageStats("source")
+        self.stage_stats = [StageStats(stage.name) for stage in self.stages]
+        self._stop = threading.Event()
+        self._error = None
+
+    def _put(self, q, item, stats):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.output_wait_seconds += time.perf_counter() - start
+
+    def _get(self, q, stats):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        else:
+            item = _END
+        stats.input_wait_seconds += time.perf_counter() - start
+        return item
+
+    def _feed(self, source, q_out):
+        stats = self.source_stats
+        stats.started = time.perf_counter()
+        try:
+            iterator = iter(source)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                batch = list(itertools.islice(iterator, self.batch_size))
+                stats.busy_seconds += time.perf_counter() - start
+                if not batch:
+                    break
+                stats.items += len(batch)
+                stats.batches += 1
+                self._put(q_out, batch, stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            stats.finished = time.perf_counter()
+            self._put(q_out, _END, stats)
+
+    def _run_stage(self, stage, stats, q_in, q_out):
+        stats.started = time.perf_counter()
+        pool = stage.make_pool()
+        pending = deque()
+        try:
+            while True:
+                batch = self._get(q_in, stats)
+                if batch is _END:
+                    break
+                stats.items += len(batch)
+                stats.batches += 1
+                if pool is None:
+                    start = time.perf_counter()
+                    result = _apply_batch(stage.fn, batch)
+                    stats.busy_seconds += time.perf_counter() - start
+                    self._put(q_out, result, stats)
+                    continue
+                # Keep a bounded number of batches in flight, emitted in order
+                pending.append(stage.submit(pool, batch))
+                while len(pending) > stage.workers:
+                    self._emit_next(pending, stats, q_out)
+            while pending:
+                self._emit_next(pending, stats, q_out)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            stats.finished = time.perf_counter()
+            self._put(q_out, _END, stats)
+
+    def _emit_next(self, pending, stats, q_out):
+        start = time.perf_counter()
+        result = pending.popleft().result()
+        stats.busy_seconds += time.perf_counter() - start
+        self._put(q_out, result, stats)
+
+    def _fail(self, error):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def run(self, source):
+        """
+        Stream items from source through every stage, yielding final results in order.
+
+        Each run starts with fresh stats, so stats() describes the latest run.
+        """
+        self._reset()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(stage, self.stage_stats[i], queues[i], queues[i + 1]),
+                daemon=True))
+        for thread in threads:
+            thread.start()
+
+        sink_stats = StageStats("sink")
+        try:
+            while True:
+                batch = self._get(queues[-1], sink_stats)
+                if batch is _END:
+                    break
+                yield from batch
+        finally:
+            # Also reached when the consumer stops iterating early
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def stats(self):
+        """Per-stage throughput, busy time and queue waits"""
+        return {stats.name: stats.to_dict() for stats in [self.source_stats] + self.stage_stats}
+
+    def print_stats(self):
+        print(f"{'Stage':<10} {'Items':>9} {'Items/s':>11} {'Busy s':>8} {'Starved s':>10} {'Blocked s':>10}")
+        print("-" * 63)
+        for name, stats in self.stats().items():
+            print(f"{name:<10} {stats['items']:>9d} {stats['items_per_sec']:>11.1f} "
+                  f"{stats['busy_seconds']:>8.3f} {stats['input_wait_seconds']:>10.3f} "
+                  f"{stats['output_wait_seconds']:>10.3f}")
+
+# Stage functions for text -> tokens -> BPE subwords -> LM score.
+# Classes rather than closures so they can be sent to process pools.
+
+class BPEEncode:
+    """
+    Segment every token of a token list with a trained BPE model.
+
+    Segmentations are cached per word; the cache is cleared once it holds
+    `cache_size` words so memory stays bounded on open-ended streams.
+    """
+
+    def __init__(self, bpe, cache_size=100000):
+        self.bpe = bpe
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def __call__(self, tokens):
+        cache = self.cache
+        subwords = []
+        hits = 0
+        for token in tokens:
+            segments = cache.get(token)
+            if segments is None:
+                if len(cache) >= self.cache_size:
+                    cache.clear()
+                segments = cache[token] = self.bpe.segment_word(token)
+            else:
+                hits += 1
+            subwords.extend(segments)
+        if METRICS.enabled:
+            METRICS.incr("bpe.cache_hits", hits)
+            METRICS.incr("bpe.cache_misses", len(tokens) - hits)
+        return subwords
+
+class LMScore:
+    """Score a subword sequence with a bigram model, wrapped in <s> ... </s>"""
+
+    def __init__(self, model, k=1.0):
+        self.model = model
+        self.k = k
+
+    def __call__(self, subwords):
+        return self.model.score_tokens(["<s>"] + subwords + ["</s>"], k=self.k)
+
+def text_scoring_pipeline(bpe, model, executor=None, workers=1, batch_size=64, queue_size=4, k=1.0):
+    """Build the tokenize -> BPE encode -> LM score pipeline"""
+    stages = [
+        Stage("tokenize", manual_tokenization, executor, workers),
+        Stage("bpe", BPEEncode(bpe), executor, workers),
+        Stage("score", LMScore(model, k), executor, workers),
+    ]
+    return Pipeline(stages, batch_size=batch_size, queue_size=queue_size)
+
+def train_demo_models(lines, num_merges=200):
+    """Train a BPE model and a bigram model over its subwords from lines of text"""
+    bpe = BPELearner()
+    bpe.train(' '.join(' '.join(manual_tokenization(line)) for line in lines), num_merges, verbose=False)
+    encode = BPEEncode(bpe)
+    model = BigramLanguageModel()
+    model.train(' '.join(["<s>"] + encode(manual_tokenization(line)) + ["</s>"]) for line in lines)
+    return bpe, model
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream text through tokenize -> BPE -> LM score")
+    parser.add_argument("input", nargs='?', help="text file, one document per line (default: synthetic)")
+    parser.add_argument("--lines", type=int, default=20000, help="synthetic lines to stream")
+    parser.add_argument("--executor", choices=["thread", "process"], default=None)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queue-size", type=int, default=4)
+    args = parser.parse_args()
+
+    from benchmarks import synthetic_paragraphs
+    training = synthetic_paragraphs(2000, 2000, seed=0).split('. ')
+    bpe, model = train_demo_models(training)
+
+    if args.input:
+        source = open(args.input, encoding='utf-8')
+    else:
+        source = itertools.islice(itertools.cycle(training), args.lines)
+
+    pipeline = text_scoring_pipeline(bpe, model, args.executor, args.workers,
+                                     args.batch_size, args.queue_size)
+    count = 0
+    total = 0.0
+    for score in pipeline.run(source):
+        count += 1
+        total += score
+    print(f"Scored {count} documents, mean log probability {total / max(count, 1):.2f}\n")
+    pipeline.print_stats()
+
+if __name__ == "__main__":
+    main()
@@ -13,11 +13,26 @@ Check out the product details at: https://www.example.com/product-info.
 Please send feedback to feedback@example.org.
 """
 
+PATTERNS = {
+    "Dates": r'\b(0?[1-9]|1[0-2])\/(0?[1-9]|[12][0-9]|3[01])\/\d{4}\b',
+    "URLs": r'https?:\/\/[^\s]+',
+    "Email addresses": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    "Currency amounts": r'\$\s?\d+(?:,\d{3})*(?:\.\d{2})?',
+    "3-letter words": r'\b[A-Za-z]{3}\b',
+    "Phone numbers": r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
+}
+
+COMPILED_PATTERNS = {name: re.compile(pattern) for name, pattern in PATTERNS.items()}
+
+def extract_all(text):
+    """Run every pattern over text and return the matches by pattern name"""
+    return {name: pattern.findall(text) for name, pattern in COMPILED_PATTERNS.items()}
+
 def test_regex_patterns():
     """Test all 6 regex patterns with sample data."""
     
     # 1. Dates in MM/DD/YYYY format
-    date_pattern = r'\b(0?[1-9]|1[0-2])\/(0?[1-9]|[12][0-9]|3[01])\/\d{4}\b'
+    date_pattern = PATTERNS["Dates"]
     print("1. DATES (MM/DD/YYYY):")
     date_matches = re.findall(date_pattern, test_text)
     for match in date_matches:
@@ -25,7 +40,7 @@ def test_regex_patterns():
     print()
     
     # 2. URLs (http/https)
-    url_pattern = r'https?:\/\/[^\s]+'
+    url_pattern = PATTERNS["URLs"]
     print("2. URLS:")
     url_matches = re.findall(url_pattern, test_text)
     for match in url_matches:
@@ -33,7 +48,7 @@ def test_regex_patterns():
     print()
     
     # 3. Email addresses
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+    email_pattern = PATTERNS["Email addresses"]
     print("3. EMAIL ADDRESSES:")
     email_matches = re.findall(email_pattern, test_text)
     for match in email_matches:
@@ -41,7 +56,7 @@ def test_regex_patterns():
     print()
     
     # 4. Currency amounts (e.g., $45.99)
-    currency_pattern = r'\$\s?\d+(?:,\d{3})*(?:\.\d{2})?'
+    currency_pattern = PATTERNS["Currency amounts"]
     print("4. CURRENCY AMOUNTS:")
     currency_matches = re.findall(currency_pattern, test_text)
     for match in currency_matches:
@@ -49,7 +64,7 @@ def test_regex_patterns():
     print()
     
     # 5. Words that are exactly 3 letters long
-    three_letter_word_pattern = r'\b[A-Za-z]{3}\b'
+    three_letter_word_pattern = PATTERNS["3-letter words"]
     print("5. THREE-LETTER WORDS:")
     three_letter_matches = re.findall(three_letter_word_pattern, test_text)
     for match in three_letter_matches:
@@ -57,7 +72,7 @@ def test_regex_patterns():
     print()
     
     # 6. Phone numbers (e.g., ###-###-####)
-    phone_number_pattern = r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
+    phone_number_pattern = PATTERNS["Phone numbers"]
     print("6. PHONE NUMBERS:")
     phone_number_matches = re.findall(phone_number_pattern, test_text)
     for match in phone_number_matches:
@@ -71,14 +86,5 @@ if __name__ == "__main__":
     print("\n" + "="*60)
     print("SUMMARY OF PATTERNS:")
     print("="*60)
-    patterns = {
-        "Dates": r'\b(0?[1-9]|1[0-2])\/(0?[1-9]|[12][0-9]|3[01])\/\d{4}\b',
-        "URLs": r'https?:\/\/[^\s]+',
-        "Email addresses": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-        "Currency amounts": r'\$\s?\d+(?:,\d{3})*(?:\.\d{2})?',
-        "3-letter words": r'\b[A-Za-z]{3}\b',
-        "Phone numbers": r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b'
-    }
-    
-    for name, pattern in patterns.items():
+    for name, pattern in PATTERNS.items():
         print(f"{name:18}: {pattern}")
\ No newline at end of file
@@ -1,29 +1,42 @@
+import os
 import re
-import nltk
-import spacy
-from nltk.tokenize import word_tokenize
+import sys
+import time
+import pickle
+import argparse
+import subprocess
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from collections import Counter
 
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-
-# Load spaCy model
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    print("Please install spaCy English model: python -m spacy download en_core_web_sm")
-    nlp = None
-
 # Sample paragraph from a science article about space exploration
 paragraph = """The James Webb Space Telescope's stunning images weren't just for show; they've provided a new understanding of our universe. Astronomers couldn't have predicted the strange-looking galaxies they'd find. Its findings are truly mind-boggling."""
 
-print("ORIGINAL PARAGRAPH:")
-print("-" * 50)
-print(paragraph)
-print("\n")
+# NLTK and spaCy are heavy, so they are only imported on first use and
+# cached per process; importing the tokenizer functions stays cheap.
+@lru_cache(maxsize=None)
+def get_word_tokenize():
+    """Return NLTK's word_tokenize, downloading punkt data if needed"""
+    import nltk
+    from nltk.tokenize import word_tokenize
+
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt')
+    return word_tokenize
+
+@lru_cache(maxsize=None)
+def get_nlp():
+    """Return the spaCy English pipeline, or None if the model is missing"""
+    import spacy
+
+    try:
+        return spacy.load("en_core_web_sm")
+    except OSError:
+        print("Please install spaCy English model: python -m spacy download en_core_web_sm")
+        return None
 
 def naive_tokenization(text):
     """Simple space-based tokenization"""
@@ -66,6 +79,139 @@ def manual_tokenization(text):
     
     return tokens
 
+# Expansion table for rewritten contractions, indexed by token code.
+# Each entry is (expansion, number of source characters it replaces);
+# code 0 means the token text is taken verbatim from the source.
+EXPANSIONS = (
+    (None, 0),
+    ("will", 2),   # "wo" of won't
+    ("can", 2),    # "ca" of can't
+    ("not", 3),    # n't
+    ("are", 3),    # 're
+    ("have", 3),   # 've
+    ("will", 3),   # 'll
+    ("would", 2),  # 'd
+)
+EXPAND_WILL, EXPAND_CAN, EXPAND_NOT = 1, 2, 3
+
+# Same contractions (and priority) as manual_tokenization, as one scan
+CONTRACTION_PATTERN = re.compile(r"(won't)|(can't)|(n't)|('re)|('ve)|('ll)|('d)|('s\b)")
+CONTRACTION_CODES = (None, EXPAND_WILL, EXPAND_CAN, EXPAND_NOT, 4, 5, 6, 7, 0)
+WORD_PATTERN = re.compile(r"\S+")
+END_PUNCTUATION = ".!?,:;"
+
+class TokenSpans:
+    """
+    Token stream stored as (start, end) offsets into the source text.
+
+    Offsets and expansion codes live in compact arrays; a token only becomes
+    a Python string when it is asked for. Tokens with a non-zero code come
+    from a rewritten contraction: their text is EXPANSIONS[code] followed by
+    any source characters left in the span after the replaced part.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = array('i')
+        self.ends = array('i')
+        self.codes = array('B')
+
+    def append(self, start, end, code=0):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        start, end, code = self.starts[i], self.ends[i], self.codes[i]
+        if code == 0:
+            return self.text[start:end]
+        expansion, consumed = EXPANSIONS[code]
+        return expansion + self.text[start + consumed:end]
+
+    def __iter__(self):
+        for i in range(len(self.starts)):
+            yield self[i]
+
+    def span(self, i):
+        """Character offsets (start, end) of token i in the source text"""
+        return self.starts[i], self.ends[i]
+
+    def is_expanded(self, i):
+        """True if token i is a rewritten contraction rather than a source slice"""
+        return self.codes[i] != 0
+
+    def tokens(self):
+        """Materialize all tokens as a list of strings"""
+        return list(self)
+
+    def ids(self, pool=None):
+        """
+        Token ids from a vocab.StringPool (the shared pool by default), as a
+        uint32 array; each token string is only alive while it is interned
+        """
+        from vocab import SHARED_POOL
+        intern = (SHARED_POOL if pool is None else pool).intern
+        return array('I', [intern(token) for token in self])
+
+def naive_token_spans(text):
+    """Space-based tokenization returning offsets instead of strings"""
+    spans = TokenSpans(text)
+    for match in WORD_PATTERN.finditer(text):
+        spans.append(match.start(), match.end())
+    return spans
+
+def _append_piece(spans, text, start, end, code):
+    """Add one post-contraction word, splitting trailing punctuation like manual_tokenization"""
+    expansion, consumed = EXPANSIONS[code]
+    if code == 0:
+        if start == end:
+            return
+        length = end - start
+    else:
+        length = len(expansion) + end - start - consumed
+
+    # Expansions are plain words, so only a source tail can end in punctuation
+    if length > 1 and end - start > consumed and text[end - 1] in END_PUNCTUATION:
+        if end - 2 >= start + consumed:
+            before_punct = text[end - 2]
+        else:
+            before_punct = expansion[-1]
+        # Keep abbreviations like "U.S." intact
+        if before_punct == '.' and length - 1 <= 4:
+            spans.append(start, end, code)
+        else:
+            spans.append(start, end - 1, code)
+            spans.append(end - 1, end)
+    else:
+        spans.append(start, end, code)
+
+def manual_token_spans(text):
+    """
+    Offset-preserving version of manual_tokenization.
+
+    Produces the same tokens as manual_tokenization for ordinary text, without
+    rewriting or copying the source. Contractions embedded in the middle of a
+    longer word ("Iwon't") split at the contraction instead of gluing the
+    expansion onto the preceding characters.
+    """
+    spans = TokenSpans(text)
+    for word in WORD_PATTERN.finditer(text):
+        piece_start, piece_code = word.start(), 0
+        for match in CONTRACTION_PATTERN.finditer(text, word.start(), word.end()):
+            start = match.start()
+            _append_piece(spans, text, piece_start, start, piece_code)
+            code = CONTRACTION_CODES[match.lastindex]
+            if code == EXPAND_WILL or code == EXPAND_CAN:
+                # "won't" -> "will not", "can't" -> "can not"
+                spans.append(start, start + 2, code)
+                start, code = start + 2, EXPAND_NOT
+            piece_start, piece_code = start, code
+        _append_piece(spans, text, piece_start, word.end(), piece_code)
+    return spans
+
 def highlight_differences(naive_tokens, manual_tokens):
     """Highlight differences between tokenization approaches"""
     print("DIFFERENCES ANALYSIS:")
@@ -118,7 +264,7 @@ def compare_with_tools(manual_tokens):
     # NLTK tokenization with error handling
     print("NLTK Word Tokenizer:")
     try:
-        nltk_tokens = word_tokenize(paragraph)
+        nltk_tokens = get_word_tokenize()(paragraph)
         for i, token in enumerate(nltk_tokens, 1):
             print(f"{i:2d}. '{token}'")
         print(f"Total tokens: {len(nltk_tokens)}")
@@ -126,12 +272,13 @@ def compare_with_tools(manual_tokens):
         print(f"NLTK tokenization failed: {e}")
         print("Using fallback regex-based tokenization...")
         # Fallback tokenization
-        nltk_tokens = re.findall(r"\b\w+(?:'\w+)?\b|[^\w\s]", paragraph)
+        nltk_tokens = regex_tokenization(paragraph)
         for i, token in enumerate(nltk_tokens, 1):
             print(f"{i:2d}. '{token}' (fallback)")
         print(f"Total tokens: {len(nltk_tokens)} (fallback)")
     
     # spaCy tokenization
+    nlp = get_nlp()
     if nlp:
         print("\nspaCy Tokenizer:")
         doc = nlp(paragraph)
@@ -161,6 +308,262 @@ def compare_with_tools(manual_tokens):
     
     return nltk_tokens, spacy_tokens
 
+def regex_tokenization(text):
+    """Regex fallback used when the NLTK tokenizer data is unavailable"""
+    return re.findall(r"\b\w+(?:'\w+)?\b|[^\w\s]", text)
+
+def nltk_tokenization(text):
+    """NLTK word tokenizer, falling back to regex_tokenization on error"""
+    try:
+        return get_word_tokenize()(text)
+    except (ImportError, LookupError):
+        return regex_tokenization(text)
+
+def nltk_available():
+    """Whether NLTK and its tokenizer data can actually be used"""
+    try:
+        get_word_tokenize()("ok")
+        return True
+    except (ImportError, LookupError):
+        return False
+
+def _tokenize_in_pool(tokenizer, documents, n_process):
+    """Run a picklable tokenizer over documents in a process pool"""
+    if n_process <= 1:
+        return [tokenizer(doc) for doc in documents]
+    chunksize = max(1, len(documents) // (n_process * 4))
+    with ProcessPoolExecutor(max_workers=n_process) as pool:
+        return list(pool.map(tokenizer, documents, chunksize=chunksize))
+
+def _spacy_tokenize_batch(nlp, documents, n_process, batch_size):
+    """Tokenize with nlp.pipe, all non-tokenizer components disabled"""
+    with nlp.select_pipes(disable=nlp.pipe_names):
+        docs = nlp.pipe(documents, batch_size=batch_size, n_process=n_process)
+        return [[token.text for token in doc] for doc in docs]
+
+def token_agreement(tokens_a, tokens_b):
+    """
+    Token-level agreement between two tokenizations of the same documents.
+
+    Returns the Dice overlap of token multisets summed over all documents and
+    the fraction of documents tokenized identically.
+    """
+    common = total = identical = 0
+    for a, b in zip(tokens_a, tokens_b):
+        common += sum((Counter(a) & Counter(b)).values())
+        total += len(a) + len(b)
+        identical += a == b
+    n_docs = len(tokens_a)
+    return {
+        'overlap': 2 * common / total if total > 0 else 1.0,
+        'identical_docs': identical / n_docs if n_docs > 0 else 1.0,
+    }
+
+def compare_tools_batch(documents, n_process=2, batch_size=256):
+    """
+    Batch comparison of the manual, NLTK and spaCy tokenizers.
+
+    NLTK and the manual tokenizer run in a process pool; spaCy uses nlp.pipe
+    with only the tokenizer active. When NLTK or its data is missing, the
+    regex fallback is run and reported as 'regex' instead of 'nltk'.
+    Returns per-tokenizer throughput and pairwise token agreement.
+    """
+    documents = list(documents)
+    tokenizers = {'manual': lambda: _tokenize_in_pool(manual_tokenization, documents, n_process)}
+    if nltk_available():
+        tokenizers['nltk'] = lambda: _tokenize_in_pool(nltk_tokenization, documents, n_process)
+    else:
+        tokenizers['regex'] = lambda: _tokenize_in_pool(regex_tokenization, documents, n_process)
+    nlp = get_nlp()
+    if nlp:
+        tokenizers['spacy'] = lambda: _spacy_tokenize_batch(nlp, documents, n_process, batch_size)
+
+    outputs = {}
+    throughput = {}
+    for name, run in tokenizers.items():
+        start = time.perf_counter()
+        outputs[name] = run()
+        elapsed = time.perf_counter() - start
+        n_tokens = sum(len(tokens) for tokens in outputs[name])
+        throughput[name] = {
+            'seconds': elapsed,
+            'docs_per_sec': len(documents) / elapsed if elapsed > 0 else float('inf'),
+            'tokens_per_sec': n_tokens / elapsed if elapsed > 0 else float('inf'),
+            'tokens': n_tokens,
+        }
+
+    names = list(outputs)
+    agreement = {}
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            agreement[f"{a} vs {b}"] = token_agreement(outputs[a], outputs[b])
+
+    return {'documents': len(documents), 'throughput': throughput, 'agreement': agreement}
+
+def print_batch_comparison(report):
+    """Print the output of compare_tools_batch"""
+    print(f"BATCH TOKENIZER COMPARISON ({report['documents']} documents):")
+    print("-" * 50)
+    print(f"{'Tokenizer':<10} {'Tokens':>10} {'Seconds':>9} {'Docs/s':>11} {'Tokens/s':>12}")
+    for name, stats in report['throughput'].items():
+        print(f"{name:<10} {stats['tokens']:>10d} {stats['seconds']:>9.3f} "
+              f"{stats['docs_per_sec']:>11.1f} {stats['tokens_per_sec']:>12.1f}")
+    if 'regex' in report['throughput']:
+        print("(NLTK unavailable: 'regex' is the fallback tokenizer)")
+
+    print("\nToken agreement:")
+    for pair, stats in report['agreement'].items():
+        print(f"  {pair:<16} overlap={stats['overlap']:.3f}  identical docs={stats['identical_docs']:.3f}")
+
+def measure_import_time(repeats=5):
+    """
+    Time a fresh-interpreter import of the tokenizer functions alone.
+
+    Each run starts a new Python process, so nothing is cached between runs.
+    Also reports whether the import pulled in spaCy or NLTK.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "from q2 import naive_tokenization, manual_tokenization, manual_token_spans\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print(elapsed, 'spacy' in sys.modules, 'nltk' in sys.modules)\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    heavy_modules = False
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                                capture_output=True, text=True).stdout.split()
+        timings.append(float(output[0]))
+        heavy_modules = heavy_modules or output[1] == 'True' or output[2] == 'True'
+    timings.sort()
+    return {
+        'repeats': repeats,
+        'min_ms': timings[0] * 1000,
+        'median_ms': timings[len(timings) // 2] * 1000,
+        'loads_spacy_or_nltk': heavy_modules,
+    }
+
+class MWETokenizer:
+    """
+    Merges multiword expressions into single tokens.
+
+    The lexicon is compiled into a token trie (one dict of children per node),
+    so any tokenizer's output can be merged in a single left-to-right pass
+    using longest-match. Lexicons can be saved and reloaded with pickle.
+    """
+
+    def __init__(self, expressions=(), separator=" ", lowercase=False):
+        self.separator = separator
+        self.lowercase = lowercase
+        self.children = [{}]
+        self.terminal = array('B', [0])
+        self.size = 0
+        for expression in expressions:
+            self.add(expression)
+
+    def _key(self, token):
+        return token.lower() if self.lowercase else token
+
+    def add(self, expression):
+        """Add an expression, given as a space-separated string or a token list"""
+        tokens = expression.split() if isinstance(expression, str) else expression
+        node = 0
+        for token in tokens:
+            # Interned keys are shared between nodes and pickled only once
+            key = sys.intern(self._key(token))
+            child = self.children[node].get(key)
+            if child is None:
+                child = len(self.children)
+                self.children[node][key] = child
+                self.children.append({})
+                self.terminal.append(0)
+            node = child
+        if node and not self.terminal[node]:
+            self.terminal[node] = 1
+            self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def find(self, tokens):
+        """Yield (start, end) token ranges of the longest leftmost matches"""
+        children, terminal = self.children, self.terminal
+        root = children[0]
+        if self.lowercase:
+            tokens = [token.lower() for token in tokens]
+        n = len(tokens)
+        i = 0
+        while i < n:
+            node = root.get(tokens[i])
+            if node is None:
+                i += 1
+                continue
+            j = i + 1
+            match_end = j if terminal[node] else 0
+            while j < n:
+                node = children[node].get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                if terminal[node]:
+                    match_end = j
+            if match_end:
+                yield i, match_end
+                i = match_end
+            else:
+                i += 1
+
+    def merge(self, tokens):
+        """Return tokens with every matched expression joined into one token"""
+        merged = []
+        last = 0
+        for start, end in self.find(tokens):
+            merged.extend(tokens[last:start])
+            merged.append(self.separator.join(tokens[start:end]))
+            last = end
+        merged.extend(tokens[last:])
+        return merged
+
+    def merge_spans(self, spans):
+        """
+        Merge expressions in a TokenSpans stream.
+
+        A merged token covers the source text from its first to its last
+        token, so it keeps the original spacing. Matches containing rewritten
+        contractions are left unmerged.
+        """
+        merged = TokenSpans(spans.text)
+        last = 0
+        for start, end in self.find(spans):
+            for i in range(last, start):
+                merged.append(spans.starts[i], spans.ends[i], spans.codes[i])
+            if any(spans.codes[start:end]):
+                for i in range(start, end):
+                    merged.append(spans.starts[i], spans.ends[i], spans.codes[i])
+            else:
+                merged.append(spans.starts[start], spans.ends[end - 1])
+            last = end
+        for i in range(last, len(spans)):
+            merged.append(spans.starts[i], spans.ends[i], spans.codes[i])
+        return merged
+
+    def save(self, path):
+        """Persist the compiled trie"""
+        state = (self.separator, self.lowercase, self.size, self.children, self.terminal)
+        with open(path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """Load a trie written by save() without recompiling the lexicon"""
+        with open(path, 'rb') as f:
+            separator, lowercase, size, children, terminal = pickle.load(f)
+        tokenizer = cls(separator=separator, lowercase=lowercase)
+        tokenizer.size, tokenizer.children, tokenizer.terminal = size, children, terminal
+        return tokenizer
+
 def identify_multiword_expressions():
     """Identify and analyze multiword expressions"""
     
@@ -208,6 +611,14 @@ def identify_multiword_expressions():
         print(f"  Would be tokenized as: {mwe['tokens']}")
         print()
 
+    # Apply the lexicon to the manual tokenizer's output
+    mwe_tokenizer = MWETokenizer(mwe['expression'] for mwe in mwes)
+    merged = mwe_tokenizer.merge(manual_tokenization(paragraph))
+    print("Manual tokens with MWEs merged:")
+    print(f"  {[token for token in merged if ' ' in token]}")
+    print(f"  Token count: {len(merged)}")
+    print()
+
 def advanced_analysis():
     """Additional analysis of tokenization challenges"""
     
@@ -259,6 +670,31 @@ def reflection():
     print(reflection_text.strip())
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokenization analysis")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="compare tokenizers on this many copies of the paragraph")
+    parser.add_argument("--n-process", type=int, default=2,
+                        help="worker processes for the batch comparison")
+    parser.add_argument("--import-benchmark", action="store_true",
+                        help="time importing the tokenizer functions in a fresh process")
+    args = parser.parse_args()
+
+    if args.import_benchmark:
+        stats = measure_import_time()
+        print(f"Import of tokenizer functions ({stats['repeats']} runs): "
+              f"min {stats['min_ms']:.1f} ms, median {stats['median_ms']:.1f} ms")
+        print(f"Loads spaCy or NLTK at import: {stats['loads_spacy_or_nltk']}")
+        sys.exit(0)
+
+    if args.batch:
+        print_batch_comparison(compare_tools_batch([paragraph] * args.batch, n_process=args.n_process))
+        sys.exit(0)
+
+    print("ORIGINAL PARAGRAPH:")
+    print("-" * 50)
+    print(paragraph)
+    print("\n")
+
     # Run complete analysis
     naive_tokens, manual_tokens = analyze_tokenization()
     nltk_tokens, spacy_tokens = compare_with_tools(manual_tokens)
@@ -274,4 +710,13 @@ if __name__ == "__main__":
     print(f"Manual tokenization:  {len(manual_tokens):2d} tokens")
     print(f"NLTK tokenization:    {len(nltk_tokens):2d} tokens")
     if spacy_tokens:
-        print(f"spaCy tokenization:   {len(spacy_tokens):2d} tokens")
\ No newline at end of file
+        print(f"spaCy tokenization:   {len(spacy_tokens):2d} tokens")
+
+    # Offsets into the original paragraph (no re-search needed)
+    print("\nMANUAL TOKEN OFFSETS:")
+    print("-" * 50)
+    spans = manual_token_spans(paragraph)
+    for i in range(len(spans)):
+        start, end = spans.span(i)
+        marker = " (expanded)" if spans.is_expanded(i) else ""
+        print(f"{i + 1:2d}. '{spans[i]}' [{start}:{end}]{marker}")
\ No newline at end of file
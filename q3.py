@@ -1,6 +1,11 @@
 import re
+import heapq
+import random
 from collections import defaultdict, Counter
 import copy
+from array import array
+from instrumentation import METRICS
+from vocab import SHARED_POOL
 
 def manual_bpe_toy_corpus():
     """
@@ -102,82 +107,111 @@ def manual_bpe_toy_corpus():
     return current_words, merges, current_vocab
 
 # Q3.2: Code a mini-BPE learner
-def coded_bpe_learner():
-    """
-    A simple, coded BPE learner for the toy corpus.
-    """
-    print("Q3.2: CODED MINI-BPE LEARNER")
-    print("-" * 40)
+class BPELearner:
+    def __init__(self):
+        self.vocab = set()
+        self.merges = []
+        self.ranks = {}
     
-    class BPELearner:
-        def __init__(self):
-            self.vocab = set()
-            self.merges = []
+    @METRICS.timed("bpe.train")
+    def train(self, corpus, num_merges, verbose=True):
+        word_counts = Counter(word + '_' for word in corpus.split())
         
-        def train(self, corpus, num_merges):
-            word_counts = Counter(word + '_' for word in corpus.split())
-            
-            # Initial vocabulary
-            self.vocab = set(''.join(word_counts.keys()))
+        # Initial vocabulary
+        self.vocab = set(''.join(word_counts.keys()))
+        if verbose:
             print(f"Initial vocabulary size: {len(self.vocab)}")
+        
+        current_tokens = {word: list(word) for word in word_counts}
+        
+        for i in range(num_merges):
+            pair_counts = defaultdict(int)
+            for word, tokens in current_tokens.items():
+                for j in range(len(tokens) - 1):
+                    pair_counts[(tokens[j], tokens[j+1])] += word_counts[word]
             
-            current_tokens = {word: list(word) for word in word_counts}
-            
-            for i in range(num_merges):
-                pair_counts = defaultdict(int)
-                for word, tokens in current_tokens.items():
-                    for j in range(len(tokens) - 1):
-                        pair_counts[(tokens[j], tokens[j+1])] += word_counts[word]
-                
-                if not pair_counts:
-                    break
-                    
-                most_frequent_pair = max(pair_counts, key=pair_counts.get)
-                count = pair_counts[most_frequent_pair]
+            if not pair_counts:
+                break
                 
+            most_frequent_pair = max(pair_counts, key=pair_counts.get)
+            count = pair_counts[most_frequent_pair]
+            
+            if verbose:
                 print(f"Step {i + 1}: Merging {most_frequent_pair} (count: {count})")
-                
-                new_token = ''.join(most_frequent_pair)
-                self.merges.append(most_frequent_pair)
-                self.vocab.add(new_token)
-                
-                # Update words with new token
-                updated_tokens = {}
-                for word, tokens in current_tokens.items():
-                    new_word_tokens = []
-                    j = 0
-                    while j < len(tokens):
-                        if j < len(tokens) - 1 and tokens[j:j+2] == list(most_frequent_pair):
-                            new_word_tokens.append(new_token)
-                            j += 2
-                        else:
-                            new_word_tokens.append(tokens[j])
-                            j += 1
-                    updated_tokens[word] = new_word_tokens
-                current_tokens = updated_tokens
-                
-                print(f"  New token: '{new_token}'")
-                print(f"  Vocabulary size: {len(self.vocab)}")
-                print()
             
-        def segment_word(self, word):
-            word = word + '_'
-            tokens = list(word)
+            new_token = ''.join(most_frequent_pair)
+            self.ranks.setdefault(most_frequent_pair, len(self.merges))
+            self.merges.append(most_frequent_pair)
+            self.vocab.add(new_token)
+            METRICS.incr("bpe.train_merges")
             
-            # Re-apply merges to segment
-            for merge_pair in self.merges:
-                new_token = ''.join(merge_pair)
-                new_tokens_list = []
-                i = 0
-                while i < len(tokens):
-                    if i < len(tokens) - 1 and tokens[i] + tokens[i+1] == new_token:
-                        new_tokens_list.append(new_token)
-                        i += 2
+            # Update words with new token
+            updated_tokens = {}
+            for word, tokens in current_tokens.items():
+                new_word_tokens = []
+                j = 0
+                while j < len(tokens):
+                    if j < len(tokens) - 1 and tokens[j:j+2] == list(most_frequent_pair):
+                        new_word_tokens.append(new_token)
+                        j += 2
                     else:
-                        new_tokens_list.append(tokens[i])
-                        i += 1
-                tokens = new_tokens_list
-            return tokens
+                        new_word_tokens.append(tokens[j])
+                        j += 1
+                updated_tokens[word] = new_word_tokens
+            current_tokens = updated_tokens
+            
+            if verbose:
+                print(f"  New token: '{new_token}'")
+                print(f"  Vocabulary size: {len(self.vocab)}")
+                print()
+        
+    @METRICS.timed("bpe.segment_word")
+    def segment_word(self, word):
+        word = word + '_'
+        tokens = list(word)
+        
+        # Re-apply merges to segment
+        for merge_pair in self.merges:
+            new_token = ''.join(merge_pair)
+            new_tokens_list = []
+            i = 0
+            while i < len(tokens):
+                if i < len(tokens) - 1 and tokens[i] + tokens[i+1] == new_token:
+                    new_tokens_list.append(new_token)
+                    i += 2
+                else:
+                    new_tokens_list.append(tokens[i])
+                    i += 1
+            tokens = new_tokens_list
+        if METRICS.enabled:
+            METRICS.incr("bpe.segment_calls")
+            METRICS.incr("bpe.merges_applied", len(word) - len(tokens))
+        return tokens
+    
+    def segment_words(self, words):
+        """Segment a batch of words, running the merges once per distinct word"""
+        segmented = {word: self.segment_word(word) for word in set(words)}
+        return [list(segmented[word]) for word in words]
+    
+    def encode_ids(self, words, pool=None):
+        """Subword ids (StringPool ids) for a batch of words, as one flat uint32 array"""
+        return _encode_ids(self.segment_word, words, SHARED_POOL if pool is None else pool)
+    
+    def sample_segment(self, word, dropout=0.1, rng=random):
+        """BPE-dropout segmentation: each applicable merge is skipped with probability dropout"""
+        return _sample_segmentation(list(word + '_'), self.ranks, dropout, rng, _join_strings)
+    
+    def sample_segments(self, words, dropout=0.1, seed=None):
+        """Sample segmentations for a batch of words with one seeded RNG"""
+        rng = random.Random(seed)
+        return [self.sample_segment(word, dropout, rng) for word in words]
+
+def coded_bpe_learner():
+    """
+    A simple, coded BPE learner for the toy corpus.
+    """
+    print("Q3.2: CODED MINI-BPE LEARNER")
+    print("-" * 40)
     
     # Train BPE
     toy_corpus = "low low low low low lowest lowest newer newer newer newer newer newer wider wider wider new new"
@@ -203,6 +237,94 @@ def coded_bpe_learner():
     return bpe
 
 ### Q3.3: BPE on your language (English paragraph)
+class AdvancedBPE:
+    def __init__(self):
+        self.vocab = set()
+        self.merges = []
+        self.ranks = {}
+        
+    @METRICS.timed("bpe.train")
+    def train(self, text, num_merges=30):
+        word_counts = Counter(word + '_' for word in text.split())
+        
+        # Initial vocabulary with characters
+        self.vocab = set(''.join(word_counts.keys()))
+        
+        current_tokens = {word: list(word) for word in word_counts}
+        
+        for i in range(num_merges):
+            pair_counts = defaultdict(int)
+            for word, tokens in current_tokens.items():
+                for j in range(len(tokens) - 1):
+                    pair_counts[(tokens[j], tokens[j+1])] += word_counts.get(''.join(tokens), 0)
+            
+            if not pair_counts:
+                break
+                
+            most_frequent_pair = max(pair_counts, key=pair_counts.get)
+            new_token = ''.join(most_frequent_pair)
+            self.ranks.setdefault(most_frequent_pair, len(self.merges))
+            self.merges.append(most_frequent_pair)
+            self.vocab.add(new_token)
+            METRICS.incr("bpe.train_merges")
+            
+            # Update word tokens
+            updated_tokens = {}
+            for word, tokens in current_tokens.items():
+                new_word_tokens = []
+                j = 0
+                while j < len(tokens):
+                    if j < len(tokens) - 1 and tokens[j:j+2] == list(most_frequent_pair):
+                        new_word_tokens.append(new_token)
+                        j += 2
+                    else:
+                        new_word_tokens.append(tokens[j])
+                        j += 1
+                updated_tokens[''.join(new_word_tokens)] = new_word_tokens
+            current_tokens = updated_tokens
+        
+        return self.merges, self.vocab
+        
+    @METRICS.timed("bpe.segment_word")
+    def segment_word(self, word):
+        word = word.lower() + '_'
+        tokens = list(word)
+        
+        for merge_pair in self.merges:
+            new_token = ''.join(merge_pair)
+            new_tokens_list = []
+            i = 0
+            while i < len(tokens):
+                if i < len(tokens) - 1 and tokens[i] + tokens[i+1] == new_token:
+                    new_tokens_list.append(new_token)
+                    i += 2
+                else:
+                    new_tokens_list.append(tokens[i])
+                    i += 1
+            tokens = new_tokens_list
+        if METRICS.enabled:
+            METRICS.incr("bpe.segment_calls")
+            METRICS.incr("bpe.merges_applied", len(word) - len(tokens))
+        return tokens
+    
+    def segment_words(self, words):
+        """Segment a batch of words, running the merges once per distinct word"""
+        segmented = {word: self.segment_word(word) for word in set(words)}
+        return [list(segmented[word]) for word in words]
+    
+    def encode_ids(self, words, pool=None):
+        """Subword ids (StringPool ids) for a batch of words, as one flat uint32 array"""
+        return _encode_ids(self.segment_word, words, SHARED_POOL if pool is None else pool)
+    
+    def sample_segment(self, word, dropout=0.1, rng=random):
+        """BPE-dropout segmentation: each applicable merge is skipped with probability dropout"""
+        return _sample_segmentation(list(word.lower() + '_'), self.ranks, dropout, rng, _join_strings)
+    
+    def sample_segments(self, words, dropout=0.1, seed=None):
+        """Sample segmentations for a batch of words with one seeded RNG"""
+        rng = random.Random(seed)
+        return [self.sample_segment(word, dropout, rng) for word in words]
+
 def bpe_on_paragraph():
     """
     Trains BPE on a short English paragraph.
@@ -225,68 +347,6 @@ def bpe_on_paragraph():
     print(f"Training text: {text}")
     print()
     
-    class AdvancedBPE:
-        def __init__(self):
-            self.vocab = set()
-            self.merges = []
-            
-        def train(self, text, num_merges=30):
-            word_counts = Counter(word + '_' for word in text.split())
-            
-            # Initial vocabulary with characters
-            self.vocab = set(''.join(word_counts.keys()))
-            
-            current_tokens = {word: list(word) for word in word_counts}
-            
-            for i in range(num_merges):
-                pair_counts = defaultdict(int)
-                for word, tokens in current_tokens.items():
-                    for j in range(len(tokens) - 1):
-                        pair_counts[(tokens[j], tokens[j+1])] += word_counts.get(''.join(tokens), 0)
-                
-                if not pair_counts:
-                    break
-                    
-                most_frequent_pair = max(pair_counts, key=pair_counts.get)
-                new_token = ''.join(most_frequent_pair)
-                self.merges.append(most_frequent_pair)
-                self.vocab.add(new_token)
-                
-                # Update word tokens
-                updated_tokens = {}
-                for word, tokens in current_tokens.items():
-                    new_word_tokens = []
-                    j = 0
-                    while j < len(tokens):
-                        if j < len(tokens) - 1 and tokens[j:j+2] == list(most_frequent_pair):
-                            new_word_tokens.append(new_token)
-                            j += 2
-                        else:
-                            new_word_tokens.append(tokens[j])
-                            j += 1
-                    updated_tokens[''.join(new_word_tokens)] = new_word_tokens
-                current_tokens = updated_tokens
-            
-            return self.merges, self.vocab
-            
-        def segment_word(self, word):
-            word = word.lower() + '_'
-            tokens = list(word)
-            
-            for merge_pair in self.merges:
-                new_token = ''.join(merge_pair)
-                new_tokens_list = []
-                i = 0
-                while i < len(tokens):
-                    if i < len(tokens) - 1 and tokens[i] + tokens[i+1] == new_token:
-                        new_tokens_list.append(new_token)
-                        i += 2
-                    else:
-                        new_tokens_list.append(tokens[i])
-                        i += 1
-                tokens = new_tokens_list
-            return tokens
-    
     # Train BPE
     bpe = AdvancedBPE()
     merges, vocab = bpe.train(text, num_merges=30)
@@ -328,6 +388,245 @@ def bpe_on_paragraph():
     
     return bpe
 
+### Byte-level BPE
+# Pre-tokenizer on raw bytes: words keep one leading space, whitespace runs
+# are split off (as in GPT-2), so encode/decode round-trips exactly.
+BYTE_WORD_PATTERN = re.compile(rb" ?[^\s]+|\s+(?!\S)|\s+")
+
+class ByteBPE:
+    """
+    Byte-level BPE with a fixed base vocabulary of the 256 byte values.
+
+    Training and encoding work on bytes-like buffers (bytes, memoryview,
+    mmap) without decoding them, so any input is representable (zero OOV)
+    and non-ASCII text does not inflate the base alphabet. Token ids 0-255
+    are the raw bytes; merge i creates token id 256 + i.
+
+    encode() caches token ids per byte word; the cache is cleared once it
+    holds `cache_size` words so long-running encoders stay bounded.
+    """
+
+    def __init__(self, cache_size=100000):
+        self.merges = []
+        self.ranks = {}
+        self.vocab = [bytes([i]) for i in range(256)]
+        self.cache_size = cache_size
+        self.cache = {}
+
+    @staticmethod
+    def count_words(data, counts=None):
+        """Count pre-tokenized byte words in a buffer, adding to counts if given"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        counts = Counter() if counts is None else counts
+        counts.update(BYTE_WORD_PATTERN.findall(data))
+        return counts
+
+    @METRICS.timed("bpe.train")
+    def train(self, word_counts, num_merges):
+        """
+        Learn merges from a dictionary of pre-counted byte words.
+        
+        Pair counts are updated incrementally: each merge only revisits the
+        words that contain the merged pair, found through a pair -> words index.
+        """
+        words = [list(word) for word in word_counts]
+        freqs = list(word_counts.values())
+        pair_counts = defaultdict(int)
+        pair_words = defaultdict(set)
+        for index, symbols in enumerate(words):
+            for pair in zip(symbols, symbols[1:]):
+                pair_counts[pair] += freqs[index]
+                pair_words[pair].add(index)
+
+        # Max-heap of (-count, pair); stale entries are skipped when popped
+        heap = [(-count, pair) for pair, count in pair_counts.items()]
+        heapq.heapify(heap)
+
+        while len(self.merges) < num_merges and heap:
+            neg_count, pair = heapq.heappop(heap)
+            if pair_counts.get(pair, 0) != -neg_count or neg_count == 0:
+                continue
+            new_id = len(self.vocab)
+            self.ranks[pair] = len(self.merges)
+            self.merges.append(pair)
+            self.vocab.append(self.vocab[pair[0]] + self.vocab[pair[1]])
+            METRICS.incr("bpe.train_merges")
+
+            changed = set()
+            for index in pair_words.pop(pair, ()):
+                symbols, freq = words[index], freqs[index]
+                for old in zip(symbols, symbols[1:]):
+                    pair_counts[old] -= freq
+                    changed.add(old)
+                merged = _merge_pair(symbols, pair, new_id)
+                words[index] = merged
+                for new in zip(merged, merged[1:]):
+                    pair_counts[new] += freq
+                    pair_words[new].add(index)
+                    changed.add(new)
+            for changed_pair in changed:
+                count = pair_counts[changed_pair]
+                if count > 0:
+                    heapq.heappush(heap, (-count, changed_pair))
+                else:
+                    del pair_counts[changed_pair]
+        self.cache.clear()
+        return self.merges
+
+    def train_from_data(self, data, num_merges):
+        """Count words in a bytes-like buffer (or str, as UTF-8) and train on them"""
+        return self.train(self.count_words(data), num_merges)
+
+    def encode_word(self, word):
+        """Token ids for one pre-tokenized byte word, applying merges by rank"""
+        symbols = list(word)
+        ranks = self.ranks
+        while len(symbols) > 1:
+            best = min(zip(symbols, symbols[1:]), key=lambda pair: ranks.get(pair, _NO_RANK))
+            rank = ranks.get(best)
+            if rank is None:
+                break
+            symbols = _merge_pair(symbols, best, 256 + rank)
+        return symbols
+
+    @METRICS.timed("bpe.encode")
+    def encode(self, data):
+        """Token ids for a bytes-like buffer (bytes, memoryview, mmap) or a str as UTF-8"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        cache = self.cache
+        ids = []
+        hits = 0
+        for word in BYTE_WORD_PATTERN.findall(data):
+            encoded = cache.get(word)
+            if encoded is None:
+                if len(cache) >= self.cache_size:
+                    cache.clear()
+                encoded = cache[word] = self.encode_word(word)
+            else:
+                hits += 1
+            ids.extend(encoded)
+        if METRICS.enabled:
+            METRICS.incr("bpe.cache_hits", hits)
+        return ids
+
+    def sample_word(self, word, dropout=0.1, rng=random):
+        """BPE-dropout token ids for one byte word, reusing the merge ranks"""
+        return _sample_segmentation(list(word), self.ranks, dropout, rng, _merged_id)
+
+    def sample_encode(self, data, dropout=0.1, rng=random):
+        """BPE-dropout token ids for a whole buffer; never cached, unlike encode()"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if dropout <= 0:
+            return self.encode(data)
+        ids = []
+        for word in BYTE_WORD_PATTERN.findall(data):
+            ids.extend(_sample_segmentation(list(word), self.ranks, dropout, rng, _merged_id))
+        return ids
+
+    def sample_batch(self, documents, dropout=0.1, seed=None):
+        """Sampled encodings for a batch of documents with one seeded RNG"""
+        rng = random.Random(seed)
+        return [self.sample_encode(document, dropout, rng) for document in documents]
+
+    def decode(self, ids):
+        """Bytes for a sequence of token ids"""
+        vocab = self.vocab
+        return b''.join(vocab[i] for i in ids)
+
+    def segment_word(self, word):
+        """Byte-string segments of a word, for comparison with the char-level learners"""
+        if isinstance(word, str):
+            word = word.encode('utf-8')
+        return [self.vocab[i] for i in self.encode_word(word)]
+
+_NO_RANK = float('inf')
+
+def _encode_ids(segment_word, words, pool):
+    """Segment and intern each distinct word once, then concatenate the id arrays"""
+    encoded = {}
+    ids = array('I')
+    for word in words:
+        word_ids = encoded.get(word)
+        if word_ids is None:
+            word_ids = encoded[word] = pool.intern_many(segment_word(word))
+        ids.extend(word_ids)
+    return ids
+
+def _join_strings(first, second, rank):
+    return first + second
+
+def _merged_id(first, second, rank):
+    return 256 + rank
+
+def _sample_segmentation(symbols, ranks, dropout, rng, merge):
+    """
+    BPE-dropout on a list of symbols (Provilkov et al., 2020).
+
+    At every step each applicable merge is dropped with probability dropout
+    and the lowest-ranked surviving merge is applied at one position; stops
+    when no merge survives. A random draw is only needed for pairs that would
+    beat the best rank found so far, since no other pair can be chosen.
+    """
+    random_draw = rng.random
+    while len(symbols) > 1:
+        best_rank, best = _NO_RANK, -1
+        for i in range(len(symbols) - 1):
+            rank = ranks.get((symbols[i], symbols[i + 1]))
+            if rank is not None and rank < best_rank and random_draw() >= dropout:
+                best_rank, best = rank, i
+        if best < 0:
+            break
+        symbols[best:best + 2] = [merge(symbols[best], symbols[best + 1], best_rank)]
+    return symbols
+
+def _merge_pair(symbols, pair, new_id):
+    """Replace every non-overlapping occurrence of pair in symbols, left to right"""
+    first, second = pair
+    merged = []
+    i = 0
+    n = len(symbols)
+    while i < n:
+        if i < n - 1 and symbols[i] == first and symbols[i + 1] == second:
+            merged.append(new_id)
+            i += 2
+        else:
+            merged.append(symbols[i])
+            i += 1
+    return merged
+
+def byte_level_bpe_demo():
+    """
+    Trains byte-level BPE on UTF-8 text with non-ASCII characters.
+    """
+    print("\n\nBYTE-LEVEL BPE ON UTF-8 TEXT")
+    print("-" * 40)
+    
+    text = """
+    Natural language processing enables computers to understand human communication.
+    Café owners in Zürich and São Paulo use naïve chatbots; the résumé filter
+    rejects façade words. Machine learning models can process thousands of documents.
+    """
+    data = text.encode('utf-8')
+    char_alphabet = set(text)
+    print(f"Distinct characters in text: {len(char_alphabet)}")
+    print(f"Byte-level base vocabulary: 256 (fixed)")
+    
+    bpe = ByteBPE()
+    bpe.train_from_data(data, num_merges=60)
+    ids = bpe.encode(data)
+    print(f"Bytes: {len(data)}, tokens after 60 merges: {len(ids)}")
+    print(f"Round trip exact: {bpe.decode(ids) == data}")
+    
+    print("\nSegmentations (as UTF-8 text where possible):")
+    for word in ["processing", "Zürich", "résumé", "naïveté", "日本語"]:
+        segments = [segment.decode('utf-8', errors='backslashreplace') for segment in bpe.segment_word(word)]
+        print(f"'{word}' -> {segments}")
+    
+    return bpe
+
 if __name__ == "__main__":
     # Run all parts
     manual_bpe_toy_corpus()
@@ -336,4 +635,7 @@ if __name__ == "__main__":
     coded_bpe = coded_bpe_learner()
     
     print("\n" + "="*60)
-    paragraph_bpe = bpe_on_paragraph()
\ No newline at end of file
+    paragraph_bpe = bpe_on_paragraph()
+    
+    print("\n" + "="*60)
+    byte_bpe = byte_level_bpe_demo()
\ No newline at end of file
@@ -1,29 +1,288 @@
 import numpy as np
+from instrumentation import METRICS
 
+def symbol_ids(s1, s2):
+    """
+    Integer arrays for two sequences such that equal symbols get equal ids
+    
+    Strings map to their code points; other sequences (e.g. token lists)
+    are numbered in order of first appearance.
+    """
+    if isinstance(s1, str) and isinstance(s2, str):
+        return (np.frombuffer(s1.encode('utf-32-le'), dtype=np.uint32),
+                np.frombuffer(s2.encode('utf-32-le'), dtype=np.uint32))
+    ids = {}
+    a = np.array([ids.setdefault(symbol, len(ids)) for symbol in s1], dtype=np.intp)
+    b = np.array([ids.setdefault(symbol, len(ids)) for symbol in s2], dtype=np.intp)
+    return a, b
+
+def _fill_dp(dp, sub, dels, ins_prefix):
+    """
+    Fill rows 1..m of dp one whole row at a time
+    
+    sub[i-1] holds the substitution costs of s1[i-1] against every symbol of
+    s2 (0 for matches), dels[i-1] its deletion cost, and ins_prefix[j] the
+    total cost of inserting s2[:j]. The insertion dependency along a row,
+    row[j] = min(t[j], row[j-1] + ins[j]), is solved as a running minimum:
+    row = ins_prefix + minimum.accumulate(t - ins_prefix).
+    """
+    dp[0] = ins_prefix
+    for i in range(1, len(dp)):
+        prev = dp[i - 1]
+        row = dp[i]
+        row[0] = prev[0] + dels[i - 1]
+        np.minimum(prev[:-1] + sub[i - 1], prev[1:] + dels[i - 1], out=row[1:])
+        row -= ins_prefix
+        np.minimum.accumulate(row, out=row)
+        row += ins_prefix
+
+def _is_integral(*costs):
+    return all(isinstance(cost, (int, np.integer)) for cost in costs)
+
+# Below this many DP cells the NumPy setup costs more than the cells themselves
+SMALL_DP_CELLS = 200
+
+def _python_dp(s1, s2, sub_cost, ins_cost, del_cost):
+    """Edit distance table as nested lists, one row per character of s1"""
+    row = [j * ins_cost for j in range(len(s2) + 1)]
+    rows = [row]
+    for i, a in enumerate(s1, 1):
+        prev = row
+        row = [i * del_cost]
+        left = row[0]
+        for j, b in enumerate(s2, 1):
+            left = min(prev[j - 1] + (0 if a == b else sub_cost), prev[j] + del_cost, left + ins_cost)
+            row.append(left)
+        rows.append(row)
+    return rows
+
+@METRICS.timed("edit_distance")
 def edit_distance(s1, s2, sub_cost=1, ins_cost=1, del_cost=1):
-    """Compute minimum edit distance with DP"""
+    """Compute minimum edit distance with DP (costs must be non-negative)"""
     m, n = len(s1), len(s2)
-    dp = np.zeros((m + 1, n + 1), dtype=int)
-    
-    # Initialize first row and column
-    for i in range(m + 1):
-        dp[i][0] = i * del_cost
-    for j in range(n + 1):
-        dp[0][j] = j * ins_cost
-    
-    # Fill DP matrix
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if s1[i-1] == s2[j-1]:
-                dp[i][j] = dp[i-1][j-1]  # Match
-            else:
-                substitute = dp[i-1][j-1] + sub_cost
-                insert = dp[i][j-1] + ins_cost  
-                delete = dp[i-1][j] + del_cost
-                dp[i][j] = min(substitute, insert, delete)
+    if METRICS.enabled:
+        METRICS.incr("edit_distance.calls")
+        METRICS.incr("edit_distance.dp_cells", m * n)
+    dtype = int if _is_integral(sub_cost, ins_cost, del_cost) else float
+    if m * n <= SMALL_DP_CELLS:
+        dp = np.array(_python_dp(s1, s2, sub_cost, ins_cost, del_cost), dtype=dtype)
+        return dp[m, n], dp
+    dp = np.empty((m + 1, n + 1), dtype=dtype)
+    
+    # Substitution costs for every cell at once: 0 on matches
+    a, b = symbol_ids(s1, s2)
+    sub = np.where(a[:, None] == b[None, :], 0, sub_cost).astype(dtype)
+    dels = np.full(m, del_cost, dtype=dtype)
+    ins_prefix = np.arange(n + 1, dtype=dtype) * ins_cost
+    _fill_dp(dp, sub, dels, ins_prefix)
     
     return dp[m][n], dp
 
+def _alphabet_index(alphabet):
+    if isinstance(alphabet, dict):
+        return alphabet
+    return {symbol: i for i, symbol in enumerate(alphabet)}
+
+@METRICS.timed("edit_distance.weighted")
+def weighted_edit_distance(s1, s2, sub_costs, ins_costs, del_costs, alphabet):
+    """
+    Edit distance with per-symbol cost tables
+    
+    Args:
+        sub_costs: (V, V) array, sub_costs[x, y] = cost of replacing symbol x
+            with symbol y (the diagonal should be 0)
+        ins_costs, del_costs: (V,) arrays of insertion / deletion cost per symbol
+        alphabet: dict mapping symbol -> id, or a sequence whose positions are the ids
+    
+    Returns:
+        (distance, dp matrix) like edit_distance
+    """
+    index = _alphabet_index(alphabet)
+    a = np.array([index[symbol] for symbol in s1], dtype=np.intp)
+    b = np.array([index[symbol] for symbol in s2], dtype=np.intp)
+    m, n = len(a), len(b)
+    if METRICS.enabled:
+        METRICS.incr("edit_distance.calls")
+        METRICS.incr("edit_distance.dp_cells", m * n)
+    sub_costs = np.asarray(sub_costs)
+    ins_costs = np.asarray(ins_costs)
+    del_costs = np.asarray(del_costs)
+    dtype = np.result_type(sub_costs, ins_costs, del_costs)
+    
+    # Gather the (m, n) substitution block and per-symbol costs once
+    sub = sub_costs[np.ix_(a, b)]
+    dels = del_costs[a]
+    ins_prefix = np.zeros(n + 1, dtype=dtype)
+    np.cumsum(ins_costs[b], out=ins_prefix[1:])
+    dp = np.empty((m + 1, n + 1), dtype=dtype)
+    _fill_dp(dp, sub, dels, ins_prefix)
+    
+    return dp[m][n], dp
+
+def cost_tables(alphabet, sub_cost=1.0, ins_cost=1.0, del_cost=1.0):
+    """Uniform cost tables for weighted_edit_distance (0 on the substitution diagonal)"""
+    size = len(_alphabet_index(alphabet))
+    sub = np.full((size, size), sub_cost, dtype=float)
+    np.fill_diagonal(sub, 0)
+    return sub, np.full(size, ins_cost, dtype=float), np.full(size, del_cost, dtype=float)
+
+KEYBOARD_ROWS = ["qwertyuiop", "asdfghjkl", "zxcvbnm"]
+
+def keyboard_cost_tables(adjacent_cost=0.5, sub_cost=1.0, ins_cost=1.0, del_cost=1.0):
+    """
+    QWERTY-aware tables for lowercase letters: substituting a key with one of
+    its neighbours costs adjacent_cost instead of sub_cost
+    
+    Returns (alphabet, sub_costs, ins_costs, del_costs).
+    """
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    index = _alphabet_index(alphabet)
+    sub, ins, dele = cost_tables(alphabet, sub_cost, ins_cost, del_cost)
+    position = {key: (r, c) for r, row in enumerate(KEYBOARD_ROWS) for c, key in enumerate(row)}
+    for x, (r1, c1) in position.items():
+        for y, (r2, c2) in position.items():
+            # Same row: one key apart; adjacent rows: the two keys diagonally touching
+            if (r1 == r2 and abs(c1 - c2) == 1) or (r2 == r1 + 1 and c2 in (c1 - 1, c1)) \
+                    or (r2 == r1 - 1 and c2 in (c1, c1 + 1)):
+                sub[index[x], index[y]] = adjacent_cost
+    return alphabet, sub, ins, dele
+
+def edit_distance_batch(pairs, sub_cost=1, ins_cost=1, del_cost=1):
+    """Edit distances for a batch of (s1, s2) pairs, computing each distinct pair once"""
+    distances = {}
+    for pair in pairs:
+        if pair not in distances:
+            distances[pair] = edit_distance(pair[0], pair[1], sub_cost, ins_cost, del_cost)[0].item()
+    return [distances[pair] for pair in pairs]
+
+class IncrementalEditDistance:
+    """
+    Edit distance from a growing query to many targets at once
+    
+    Targets are stored in a trie kept as flat arrays (parent and character
+    of every node, numbered breadth-first so each depth is a contiguous
+    slice). A DP row holds, for every trie node, the distance between the
+    current query and the prefix that node spells, so targets sharing a
+    prefix share their DP cells. push(char) appends one row and pop()
+    drops it: a keystroke costs one row over the trie, never a full
+    recomputation.
+    """
+    
+    def __init__(self, targets, sub_cost=1, ins_cost=1, del_cost=1):
+        self.targets = list(targets)
+        self.sub_cost = sub_cost
+        self.ins_cost = ins_cost
+        self.del_cost = del_cost
+        dtype = int if _is_integral(sub_cost, ins_cost, del_cost) else float
+        
+        # Build a dict trie, then flatten it breadth-first
+        root = {}
+        for target in self.targets:
+            node = root
+            for char in target:
+                node = node.setdefault(char, {})
+        parents, chars, level_starts = [-1], [0], [0, 1]
+        number = {id(root): 0}
+        level = [root]
+        while level:
+            next_level = []
+            for node in level:
+                for char, child in node.items():
+                    number[id(child)] = len(parents)
+                    parents.append(number[id(node)])
+                    chars.append(ord(char))
+                    next_level.append(child)
+            if next_level:
+                level_starts.append(len(parents))
+            level = next_level
+        self.parent = np.array(parents, dtype=np.intp)
+        self.char = np.array(chars, dtype=np.uint32)
+        self.level_starts = level_starts
+        
+        # Node spelling each target
+        self.target_nodes = np.empty(len(self.targets), dtype=np.intp)
+        for t, target in enumerate(self.targets):
+            node = root
+            for char in target:
+                node = node[char]
+            self.target_nodes[t] = number[id(node)]
+        
+        depth = np.zeros(len(parents), dtype=dtype)
+        for d in range(1, len(level_starts) - 1):
+            depth[level_starts[d]:level_starts[d + 1]] = d
+        self.query = []
+        self.rows = [depth * ins_cost]
+    
+    def __len__(self):
+        return len(self.query)
+    
+    def push(self, char):
+        """Append one character to the query and compute its DP row"""
+        prev = self.rows[-1]
+        parent = self.parent[1:]
+        row = np.empty_like(prev)
+        row[0] = prev[0] + self.del_cost
+        # Substitute/match from the parent's previous row, or delete the query char
+        np.minimum(prev[parent] + (self.char[1:] != ord(char)) * self.sub_cost,
+                   prev[1:] + self.del_cost, out=row[1:])
+        # Inserting target characters depends on the parent's new value: go level by level
+        starts = self.level_starts
+        for d in range(1, len(starts) - 1):
+            level = slice(starts[d], starts[d + 1])
+            np.minimum(row[level], row[self.parent[level]] + self.ins_cost, out=row[level])
+        if METRICS.enabled:
+            METRICS.incr("edit_distance.incremental_rows")
+            METRICS.incr("edit_distance.dp_cells", len(row))
+        self.query.append(char)
+        self.rows.append(row)
+    
+    def pop(self):
+        """Remove the last query character, restoring the previous row"""
+        if not self.query:
+            raise IndexError("pop from empty query")
+        self.rows.pop()
+        return self.query.pop()
+    
+    def extend(self, chars):
+        for char in chars:
+            self.push(char)
+    
+    def set_query(self, query):
+        """Move to a new query, keeping the rows of the prefix it shares with the current one"""
+        common = 0
+        while common < min(len(query), len(self.query)) and query[common] == self.query[common]:
+            common += 1
+        while len(self.query) > common:
+            self.pop()
+        self.extend(query[common:])
+    
+    def distances(self):
+        """Edit distance from the current query to every target, in target order"""
+        return self.rows[-1][self.target_nodes]
+    
+    def matches(self, max_dist):
+        """(target, distance) pairs within max_dist, closest first"""
+        distances = self.distances()
+        hits = np.flatnonzero(distances <= max_dist)
+        hits = hits[np.argsort(distances[hits], kind='stable')]
+        return [(self.targets[t], distances[t].item()) for t in hits]
+    
+    def prefix_matches(self, max_dist):
+        """
+        Targets with a prefix within max_dist of the query (autocomplete),
+        as (target, distance to the closest prefix) pairs, closest first
+        """
+        best = self.rows[-1].copy()
+        starts = self.level_starts
+        for d in range(1, len(starts) - 1):
+            level = slice(starts[d], starts[d + 1])
+            np.minimum(best[level], best[self.parent[level]], out=best[level])
+        distances = best[self.target_nodes]
+        hits = np.flatnonzero(distances <= max_dist)
+        hits = hits[np.argsort(distances[hits], kind='stable')]
+        return [(self.targets[t], distances[t].item()) for t in hits]
+
+@METRICS.timed("edit_distance.alignment")
 def get_alignment(s1, s2, dp, sub_cost=1, ins_cost=1, del_cost=1):
     """Backtrack to get one valid edit sequence"""
     i, j = len(s1), len(s2)
@@ -60,42 +319,58 @@ def get_alignment(s1, s2, dp, sub_cost=1, ins_cost=1, del_cost=1):
     
     return list(reversed(operations))
 
-# Q4: New example: Kitten -> Sitting
-print("Q4: Edit Distance - Kitten -> Sitting")
-print("=" * 40)
+def main():
+    # Q4: New example: Kitten -> Sitting
+    print("Q4: Edit Distance - Kitten -> Sitting")
+    print("=" * 40)
+
+    s1, s2 = "Kitten", "Sitting"
+
+    # Model A: Sub=1, Ins=1, Del=1
+    print("\nModel A (Sub=1, Ins=1, Del=1):")
+    dist_a, matrix_a = edit_distance(s1, s2, 1, 1, 1)
+    alignment_a = get_alignment(s1, s2, matrix_a, 1, 1, 1)
+
+    print(f"Minimum edit distance: {dist_a}")
+    print("Edit sequence:")
+    for i, op in enumerate(alignment_a, 1):
+        print(f"  {i}. {op}")
 
-s1, s2 = "Kitten", "Sitting"
+    # Model B: Sub=2, Ins=1, Del=1  
+    print("\nModel B (Sub=2, Ins=1, Del=1):")
+    dist_b, matrix_b = edit_distance(s1, s2, 2, 1, 1)
+    alignment_b = get_alignment(s1, s2, matrix_b, 2, 1, 1)
 
-# Model A: Sub=1, Ins=1, Del=1
-print("\nModel A (Sub=1, Ins=1, Del=1):")
-dist_a, matrix_a = edit_distance(s1, s2, 1, 1, 1)
-alignment_a = get_alignment(s1, s2, matrix_a, 1, 1, 1)
+    print(f"Minimum edit distance: {dist_b}")
+    print("Edit sequence:")
+    for i, op in enumerate(alignment_b, 1):
+        print(f"  {i}. {op}")
 
-print(f"Minimum edit distance: {dist_a}")
-print("Edit sequence:")
-for i, op in enumerate(alignment_a, 1):
-    print(f"  {i}. {op}")
+    # Reflection
+    print("\nReflection:")
+    print("-" * 20)
 
-# Model B: Sub=2, Ins=1, Del=1  
-print("\nModel B (Sub=2, Ins=1, Del=1):")
-dist_b, matrix_b = edit_distance(s1, s2, 2, 1, 1)
-alignment_b = get_alignment(s1, s2, matrix_b, 2, 1, 1)
+    same_distance = "Yes" if dist_a == dist_b else "No"
+    print(f"1. Did both models give the same distance? {same_distance} (A={dist_a}, B={dist_b})")
 
-print(f"Minimum edit distance: {dist_b}")
-print("Edit sequence:")
-for i, op in enumerate(alignment_b, 1):
-    print(f"  {i}. {op}")
+    print("2. Which operations were most useful?")
+    print("   - For both models, the most useful operations were a combination of `Substitution` and `Insertion`. The transformation from 'K' to 'S' is a substitution, and the addition of 'g' at the end of 'Sitting' is an insertion. The core sequence 'itten' is a perfect match.")
 
-# Reflection
-print("\nReflection:")
-print("-" * 20)
+    print("3. How do the different models affect potential applications?")
+    print("   - **Spell Check:** In a spell checker, where typos are often single-character substitutions or insertions/deletions, Model A is a good choice because it gives equal weight to all operations. A user who types 'sitten' instead of 'sitting' would be easily corrected.")
+    print("   - **DNA Alignment:** For tasks like aligning DNA sequences, where insertions and deletions (indels) are common mutations, Model B would be more appropriate. By giving a higher cost to substitution, Model B encourages the algorithm to find an alignment path that uses indels over substitutions, which may better reflect a genetic process.")
 
-same_distance = "Yes" if dist_a == dist_b else "No"
-print(f"1. Did both models give the same distance? {same_distance} (A={dist_a}, B={dist_b})")
+    incremental_demo()
 
-print("2. Which operations were most useful?")
-print("   - For both models, the most useful operations were a combination of `Substitution` and `Insertion`. The transformation from 'K' to 'S' is a substitution, and the addition of 'g' at the end of 'Sitting' is an insertion. The core sequence 'itten' is a perfect match.")
+def incremental_demo():
+    print("\nIncremental edit distance (typing 'sittin' against a word list):")
+    print("-" * 20)
+    words = ["sitting", "sitter", "kitten", "mitten", "setting", "sifting", "station"]
+    search = IncrementalEditDistance(words)
+    for char in "sittin":
+        search.push(char)
+        print(f"  {''.join(search.query):<7} {search.matches(2)}")
+    print(f"  prefix matches within 1: {search.prefix_matches(1)}")
 
-print("3. How do the different models affect potential applications?")
-print("   - **Spell Check:** In a spell checker, where typos are often single-character substitutions or insertions/deletions, Model A is a good choice because it gives equal weight to all operations. A user who types 'sitten' instead of 'sitting' would be easily corrected.")
-print("   - **DNA Alignment:** For tasks like aligning DNA sequences, where insertions and deletions (indels) are common mutations, Model B would be more appropriate. By giving a higher cost to substitution, Model B encourages the algorithm to find an alignment path that uses indels over substitutions, which may better reflect a genetic process.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,313 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from q4 import edit_distance_batch
+
+class LatencyStats:
+    """Request latencies (most recent `window` samples) and batch-size histogram"""
+
+    def __init__(self, window=100000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.batches = 0
+
+    def record_batch(self, size):
+        self.batch_sizes[size] += 1
+        self.batches += 1
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+        self.requests += 1
+
+    def percentile(self, q):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'batch_size_histogram': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into batches for one batched engine.
+
+    A batch is dispatched when it reaches max_batch_size or when max_delay
+    seconds have passed since its first request, whichever comes first.
+    While a batch is being computed, new requests queue up and form the next
+    batch, so batches grow naturally under load.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=64, max_delay=0.002, executor=None):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.executor = executor
+        self.stats = LatencyStats()
+        self.queue = asyncio.Queue()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, item):
+        """Queue one request and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.stats.record_batch(len(batch))
+            items = [item for item, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+            except Exception:
+                # Retry one by one so only the offending request gets the error
+                results = await loop.run_in_executor(self.executor, self._run_individually, items)
+            else:
+                results = [(True, result) for result in results]
+            now = time.perf_counter()
+            for (_, future, start), (ok, result) in zip(batch, results):
+                if not future.done():
+                    if ok:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(result)
+                self.stats.record_latency(now - start)
+
+    def _run_individually(self, items):
+        """Run batch_fn on single-item batches, returning (ok, result or exception) pairs"""
+        results = []
+        for item in items:
+            try:
+                results.append((True, self.batch_fn([item])[0]))
+            except Exception as e:
+                results.append((False, e))
+        return results
+
+def _require_str(request, key):
+    value = request.get(key)
+    if not isinstance(value, str):
+        raise TypeError(f"'{key}' must be a string, got {type(value).__name__}")
+    return value
+
+class NLPServer:
+    """
+    Line-delimited JSON server over TCP for BPE segmentation, edit distance
+    and bigram scoring.
+
+    Requests look like {"id": 1, "op": "segment", "word": "newest"},
+    {"op": "distance", "source": "kitten", "target": "sitting"} or
+    {"op": "score", "tokens": ["<s>", "I", "love", "NLP", "</s>"]}.
+    {"op": "stats"} returns latency percentiles and batch-size histograms.
+    Responses echo the request id and may arrive out of order.
+    """
+
+    def __init__(self, bpe, model, max_batch_size=64, max_delay=0.002, k=1.0):
+        # One worker thread keeps each engine call on a single thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batchers = {
+            'segment': MicroBatcher('segment', bpe.segment_words, max_batch_size, max_delay, self.executor),
+            'distance': MicroBatcher('distance', edit_distance_batch, max_batch_size, max_delay, self.executor),
+            'score': MicroBatcher('score', lambda batch: model.score_batch(batch, k),
+                                  max_batch_size, max_delay, self.executor),
+        }
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        for batcher in self.batchers.values():
+            batcher.start()
+        self.server = await asyncio.start_server(self._handle_client, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.executor.shutdown()
+
+    def stats(self):
+        return {name: batcher.stats.to_dict() for name, batcher in self.batchers.items()}
+
+    async def _dispatch(self, request):
+        # Type-check before batching so one malformed request cannot break a batch
+        op = request.get('op')
+        if op == 'segment':
+            return await self.batchers['segment'].submit(_require_str(request, 'word'))
+        if op == 'distance':
+            pair = (_require_str(request, 'source'), _require_str(request, 'target'))
+            return await self.batchers['distance'].submit(pair)
+        if op == 'score':
+            tokens = request.get('tokens')
+            if not isinstance(tokens, list) or not all(isinstance(t, str) for t in tokens):
+                raise TypeError("'tokens' must be a list of strings")
+            return await self.batchers['score'].submit(tokens)
+        if op == 'stats':
+            return self.stats()
+        raise ValueError(f"Unknown op: {op}")
+
+    async def _respond(self, line, writer, lock):
+        request = None
+        try:
+            request = json.loads(line)
+            response = {'id': request.get('id'), 'result': await self._dispatch(request)}
+        except Exception as e:
+            response = {'id': request.get('id') if isinstance(request, dict) else None,
+                        'error': f"{type(e).__name__}: {e}"}
+        async with lock:
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+    async def _handle_client(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._respond(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+async def _client(host, port, requests):
+    """Send requests over one connection, pipelined, and collect responses by id"""
+    reader, writer = await asyncio.open_connection(host, port)
+    for request in requests:
+        writer.write(json.dumps(request).encode() + b'\n')
+    await writer.drain()
+    responses = {}
+    for _ in requests:
+        response = json.loads(await reader.readline())
+        responses[response['id']] = response
+    writer.close()
+    await writer.wait_closed()
+    return responses
+
+async def run_load_test(n_clients=50, requests_per_client=40, max_batch_size=64, max_delay=0.002, seed=0):
+    """Start a server on localhost, drive it with concurrent clients and return its stats"""
+    from pipeline import train_demo_models
+    from benchmarks import synthetic_paragraphs, synthetic_words
+
+    training = synthetic_paragraphs(500, 1000, seed).split('. ')
+    bpe, model = train_demo_models(training, num_merges=100)
+    words = synthetic_words(n_clients * requests_per_client, 1000, seed)
+    rng = random.Random(seed)
+
+    server = NLPServer(bpe, model, max_batch_size, max_delay)
+    host, port = await server.start()
+    try:
+        client_requests = []
+        for c in range(n_clients):
+            requests = []
+            for r in range(requests_per_client):
+                word = words[c * requests_per_client + r]
+                op = ('segment', 'distance', 'score')[r % 3]
+                request = {'id': r, 'op': op}
+                if op == 'segment':
+                    request['word'] = word
+                elif op == 'distance':
+                    request['source'], request['target'] = word, rng.choice(words)
+                else:
+                    request['tokens'] = ["<s>"] + bpe.segment_word(word) + ["</s>"]
+                requests.append(request)
+            client_requests.append(requests)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(_client(host, port, requests) for requests in client_requests))
+        elapsed = time.perf_counter() - start
+        errors = sum('error' in response for responses in results for response in responses.values())
+        return {'seconds': elapsed, 'requests': n_clients * requests_per_client,
+                'errors': errors, 'engines': server.stats()}
+    finally:
+        await server.stop()
+
+def print_stats(report):
+    print(f"Served {report['requests']} requests in {report['seconds']:.3f}s "
+          f"({report['requests'] / report['seconds']:.0f} req/s), {report['errors']} errors\n")
+    print(f"{'Engine':<10} {'Batches':>8} {'Mean size':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    print("-" * 48)
+    for name, stats in report['engines'].items():
+        print(f"{name:<10} {stats['batches']:>8d} {stats['mean_batch_size']:>10.1f} "
+              f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+    print("\nBatch-size histograms:")
+    for name, stats in report['engines'].items():
+        print(f"  {name}: {stats['batch_size_histogram']}")
+
+async def serve(host, port, max_batch_size, max_delay):
+    from pipeline import train_demo_models
+    from benchmarks import synthetic_paragraphs
+
+    bpe, model = train_demo_models(synthetic_paragraphs(500, 1000, 0).split('. '), num_merges=100)
+    server = NLPServer(bpe, model, max_batch_size, max_delay)
+    host, port = await server.start(host, port)
+    print(f"Serving on {host}:{port}")
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching NLP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-delay-ms", type=float, default=2.0,
+                        help="latency budget for filling a batch")
+    parser.add_argument("--load-test", action="store_true",
+                        help="run a localhost load test instead of serving")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=40, help="requests per client")
+    args = parser.parse_args()
+
+    if args.load_test:
+        report = asyncio.run(run_load_test(args.clients, args.requests, args.max_batch_size,
+                                           args.max_delay_ms / 1000))
+        print_stats(report)
+    else:
+        asyncio.run(serve(args.host, args.port, args.max_batch_size, args.max_delay_ms / 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import math
+import time
+import random
+import argparse
+from collections import defaultdict
+
+from q4 import edit_distance, weighted_edit_distance
+from Q8 import BigramLanguageModel
+from instrumentation import METRICS
+
+SENTENCE_MARKERS = ("<s>", "</s>")
+
+def deletes(word, max_distance):
+    """Every string obtained from word by deleting up to max_distance characters (word included)"""
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - found
+        found |= frontier
+    return found
+
+class DeletionIndex:
+    """
+    SymSpell-style candidate index.
+
+    Every vocabulary word is stored under each of its deletes (up to
+    max_distance characters removed). Two words within edit distance k share
+    at least one delete, so a lookup only has to generate the deletes of the
+    query instead of every insertion/substitution over the alphabet; the
+    few false positives are removed by checking the real edit distance.
+    """
+
+    def __init__(self, vocabulary, max_distance=2):
+        self.max_distance = max_distance
+        self.words = set(vocabulary)
+        self.index = defaultdict(list)
+        for word in self.words:
+            for key in deletes(word, max_distance):
+                self.index[key].append(word)
+
+    def lookup(self, word, max_distance=None):
+        """Vocabulary words within max_distance of word, as (candidate, distance) pairs"""
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+        candidates = set()
+        for key in deletes(word, max_distance):
+            candidates.update(self.index.get(key, ()))
+        results = []
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+            distance = 0 if candidate == word else edit_distance(word, candidate)[0]
+            if distance <= max_distance:
+                results.append((candidate, int(distance)))
+        if METRICS.enabled:
+            METRICS.incr("spell.candidates_checked", len(candidates))
+        return results
+
+class SpellCorrector:
+    """
+    Noisy-channel spelling corrector.
+
+    For each token, candidates within max_distance come from a DeletionIndex
+    over the language model's vocabulary. A corrected sentence w1..wn of an
+    observed x1..xn is scored as
+
+        sum_i log P(w_i | w_{i-1}) + log P(x_i | w_i)
+
+    with the add-k smoothed bigram model for the first term and a channel
+    model that charges edit_log_prob per unit of edit distance (optionally
+    weighted by q4 cost tables) and oov_log_prob for keeping a word that is
+    not in the vocabulary. A beam over positions keeps the best
+    `beam_width` partial corrections, one per last word since the bigram
+    model only looks one word back.
+
+    Candidate lists and bigram log probabilities are cached; each cache is
+    cleared once it holds cache_size entries.
+    """
+
+    def __init__(self, model, max_distance=2, k=1.0, edit_log_prob=math.log(0.01),
+                 max_candidates=10, beam_width=8, costs=None, cache_size=100000,
+                 oov_log_prob=math.log(1e-6)):
+        self.model = model
+        self.max_distance = max_distance
+        self.k = k
+        self.edit_log_prob = edit_log_prob
+        # Channel cost of leaving a non-word as it is; well below one edit
+        self.oov_log_prob = oov_log_prob
+        self.max_candidates = max_candidates
+        self.beam_width = beam_width
+        # Optional (alphabet, sub_costs, ins_costs, del_costs) for weighted_edit_distance
+        self.costs = costs
+        self.cache_size = cache_size
+        vocabulary = [word for word in model.vocabulary if word not in SENTENCE_MARKERS]
+        self.index = DeletionIndex(vocabulary, max_distance)
+        self.candidate_cache = {}
+        self.score_cache = {}
+
+    def _channel_log_prob(self, observed, candidate, distance):
+        if distance and self.costs is not None:
+            alphabet, sub_costs, ins_costs, del_costs = self.costs
+            try:
+                distance = weighted_edit_distance(candidate, observed, sub_costs,
+                                                  ins_costs, del_costs, alphabet)[0]
+            except KeyError:
+                pass  # symbol outside the cost alphabet: keep the unit distance
+        return distance * self.edit_log_prob
+
+    def candidates(self, word):
+        """(candidate, channel log probability) pairs for an observed word"""
+        found = self.index.lookup(word)
+        counts = self.model.unigram_counts
+        # Closest first, then most frequent
+        found.sort(key=lambda item: (item[1], -counts[item[0]], item[0]))
+        found = found[:self.max_candidates]
+        options = [(candidate, self._channel_log_prob(word, candidate, distance))
+                   for candidate, distance in found]
+        if word not in self.index.words:
+            # Unknown words may stay as they are, but a nearby real word should win
+            options.append((word, self.oov_log_prob))
+        return options
+
+    def _cached_candidates(self, word):
+        cached = self.candidate_cache.get(word)
+        if cached is not None:
+            return cached, True
+        if len(self.candidate_cache) >= self.cache_size:
+            self.candidate_cache.clear()
+        cached = self.candidate_cache[word] = self.candidates(word)
+        return cached, False
+
+    def _log_prob(self, prev_word, word):
+        key = (prev_word, word)
+        cached = self.score_cache.get(key)
+        if cached is not None:
+            return cached, True
+        if len(self.score_cache) >= self.cache_size:
+            self.score_cache.clear()
+        cached = self.score_cache[key] = self.model.get_log_probability(prev_word, word, self.k)
+        return cached, False
+
+    @METRICS.timed("spell.correct")
+    def correct_tokens(self, tokens):
+        """
+        Most probable correction of a token list (without <s>/</s> markers)
+
+        Returns:
+            (corrected tokens, log score)
+        """
+        candidate_hits = score_hits = score_lookups = 0
+        # Beam entries: last word -> (score, back-pointer chain)
+        beam = {"<s>": (0.0, None)}
+        for word in tokens:
+            options, hit = self._cached_candidates(word)
+            candidate_hits += hit
+            expanded = {}
+            for prev_word, (score, chain) in beam.items():
+                for candidate, channel in options:
+                    log_prob, hit = self._log_prob(prev_word, candidate)
+                    score_hits += hit
+                    score_lookups += 1
+                    total = score + log_prob + channel
+                    best = expanded.get(candidate)
+                    if best is None or total > best[0]:
+                        expanded[candidate] = (total, (candidate, chain))
+            beam = dict(sorted(expanded.items(), key=lambda item: item[1][0],
+                               reverse=True)[:self.beam_width])
+
+        best_score = -math.inf
+        best_chain = None
+        for prev_word, (score, chain) in beam.items():
+            log_prob, hit = self._log_prob(prev_word, "</s>")
+            score_hits += hit
+            score_lookups += 1
+            if best_chain is None or score + log_prob > best_score:
+                best_score, best_chain = score + log_prob, chain
+
+        corrected = []
+        while best_chain is not None:
+            word, best_chain = best_chain
+            corrected.append(word)
+        corrected.reverse()
+
+        if METRICS.enabled:
+            METRICS.incr("spell.candidate_cache_hits", candidate_hits)
+            METRICS.incr("spell.candidate_cache_misses", len(tokens) - candidate_hits)
+            METRICS.incr("spell.score_cache_hits", score_hits)
+            METRICS.incr("spell.score_cache_misses", score_lookups - score_hits)
+        return corrected, best_score
+
+    def correct(self, sentence):
+        """Correct a whitespace-separated sentence or a token list; returns the same type"""
+        if isinstance(sentence, str):
+            tokens = [t for t in sentence.split() if t not in SENTENCE_MARKERS]
+            return ' '.join(self.correct_tokens(tokens)[0])
+        return self.correct_tokens([t for t in sentence if t not in SENTENCE_MARKERS])[0]
+
+    def correct_batch(self, sentences):
+        """Correct a batch of sentences; caches are shared across the batch"""
+        return [self.correct(sentence) for sentence in sentences]
+
+def corrupt(word, rng, alphabet="abcdefghijklmnopqrstuvwxyz"):
+    """Apply one random insertion, deletion or substitution"""
+    i = rng.randrange(len(word) + 1)
+    op = rng.choice(("insert", "delete", "substitute") if len(word) > 1 else ("insert",))
+    if op == "insert":
+        return word[:i] + rng.choice(alphabet) + word[i:]
+    i = min(i, len(word) - 1)
+    if op == "delete":
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice(alphabet.replace(word[i], '')) + word[i + 1:]
+
+def evaluate(corrector, sentences, error_rate=0.15, seed=0):
+    """Corrupt words of held-out sentences and measure word accuracy and latency"""
+    rng = random.Random(seed)
+    clean, noisy = [], []
+    for sentence in sentences:
+        tokens = [t for t in sentence.split() if t not in SENTENCE_MARKERS]
+        clean.append(tokens)
+        noisy.append([corrupt(t, rng) if rng.random() < error_rate else t for t in tokens])
+
+    start = time.perf_counter()
+    corrected = corrector.correct_batch(noisy)
+    elapsed = time.perf_counter() - start
+
+    words = sum(len(tokens) for tokens in clean)
+    errors_before = sum(a != b for c, n in zip(clean, noisy) for a, b in zip(c, n))
+    errors_after = sum(a != b for c, f in zip(clean, corrected) for a, b in zip(c, f))
+    return {'sentences': len(sentences), 'words': words,
+            'errors_before': errors_before, 'errors_after': errors_after,
+            'ms_per_sentence': elapsed / max(len(sentences), 1) * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description="Noisy-channel spelling correction demo")
+    parser.add_argument("--train", type=int, default=5000, help="synthetic training sentences")
+    parser.add_argument("--test", type=int, default=500, help="held-out sentences to corrupt")
+    parser.add_argument("--vocab", type=int, default=1000)
+    parser.add_argument("--max-distance", type=int, default=2)
+    parser.add_argument("--keyboard", action="store_true", help="cheaper substitutions between neighbouring keys")
+    args = parser.parse_args()
+
+    from benchmarks import synthetic_sentences
+    from q4 import keyboard_cost_tables
+    # One draw so training and held-out sentences share a vocabulary
+    sentences = synthetic_sentences(args.train + args.test + 3, args.vocab, seed=0)
+    training, examples, held_out = sentences[:args.train], sentences[-3:], sentences[args.train:-3]
+    model = BigramLanguageModel()
+    model.train(training)
+    costs = keyboard_cost_tables() if args.keyboard else None
+    corrector = SpellCorrector(model, max_distance=args.max_distance, costs=costs)
+
+    print("=== EXAMPLES ===")
+    rng = random.Random(1)
+    for sentence in examples:
+        tokens = sentence.split()[1:-1]
+        noisy = ' '.join(corrupt(t, rng) if i % 3 == 1 else t for i, t in enumerate(tokens))
+        print(f"Noisy:     {noisy}")
+        print(f"Corrected: {corrector.correct(noisy)}")
+        print(f"Original:  {' '.join(tokens)}\n")
+
+    report = evaluate(corrector, held_out)
+    print("=== EVALUATION ===")
+    print(f"Sentences: {report['sentences']}, words: {report['words']}")
+    print(f"Word errors: {report['errors_before']} -> {report['errors_after']}")
+    print(f"Latency: {report['ms_per_sentence']:.2f} ms per sentence")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import sys
+import mmap
+import time
+import struct
+import argparse
+from array import array
+from zlib import crc32
+
+# File layout: header, offsets (uint64, n + 1), hashes (uint32, n),
+# table (int32, capacity), UTF-8 data
+_MAGIC = b"STRPOOL1"
+_HEADER = struct.Struct("<8sQQQ")  # magic, n_strings, capacity, data bytes
+_EMPTY = -1
+
+class StringPool:
+    """
+    Compact string interning table: string <-> dense integer id.
+
+    Strings are stored once, back to back, as UTF-8 in a single buffer with
+    an offsets array; id i is data[offsets[i]:offsets[i + 1]]. Lookups go
+    through an open-addressing hash table (crc32, linear probing) of int32
+    ids, with each string's hash kept so the table can grow without
+    re-hashing. Everything lives in flat arrays, so a pool can be saved and
+    memory-mapped back without parsing (see save/load). A loaded pool is
+    copied into private memory the first time a new string is added.
+    """
+
+    def __init__(self, strings=(), capacity=1024):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+        self.hashes = array('I')
+        self.table = array('i', [_EMPTY]) * size
+        self._mmap = None
+        self._file = None
+        for s in strings:
+            self.intern(s)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _probe(self, encoded, h):
+        """Table slot holding encoded, or the empty slot where it would go"""
+        table, offsets, hashes, data = self.table, self.offsets, self.hashes, self.data
+        mask = len(table) - 1
+        slot = h & mask
+        while True:
+            i = table[slot]
+            if i == _EMPTY:
+                return slot
+            if hashes[i] == h and data[offsets[i]:offsets[i + 1]] == encoded:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        size = len(self.table) * 2
+        mask = size - 1
+        table = array('i', [_EMPTY]) * size
+        for i, h in enumerate(self.hashes):
+            slot = h & mask
+            while table[slot] != _EMPTY:
+                slot = (slot + 1) & mask
+            table[slot] = i
+        self.table = table
+
+    def intern(self, s):
+        """Id of s, adding it to the pool if it is new"""
+        encoded = s.encode('utf-8')
+        h = crc32(encoded)
+        slot = self._probe(encoded, h)
+        i = self.table[slot]
+        if i != _EMPTY:
+            return i
+        if self._mmap is not None:
+            self._make_writable()
+        i = len(self.hashes)
+        self.data += encoded
+        self.offsets.append(len(self.data))
+        self.hashes.append(h)
+        # Keep the load factor at or below 1/2 so probe runs stay short
+        if 2 * (i + 1) > len(self.table):
+            self._grow()
+            slot = self._probe(encoded, h)
+        self.table[slot] = i
+        return i
+
+    def get(self, s, default=None):
+        """Id of s, or default if it was never interned"""
+        encoded = s.encode('utf-8')
+        i = self.table[self._probe(encoded, crc32(encoded))]
+        return default if i == _EMPTY else i
+
+    def __contains__(self, s):
+        return self.get(s) is not None
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def intern_many(self, strings):
+        """Ids for an iterable of strings, as a compact uint32 array"""
+        intern = self.intern
+        return array('I', [intern(s) for s in strings])
+
+    def lookup_many(self, strings, default=_EMPTY):
+        """Ids for strings without adding new ones (default for unknown strings)"""
+        get = self.get
+        return [get(s, default) for s in strings]
+
+    def strings(self, ids):
+        """Strings for an iterable of ids"""
+        return [self[i] for i in ids]
+
+    def nbytes(self):
+        """Bytes used by the pool's buffers"""
+        return (len(self.data) + self.offsets.itemsize * len(self.offsets)
+                + self.hashes.itemsize * len(self.hashes) + self.table.itemsize * len(self.table))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(self), len(self.table), len(self.data)))
+            f.write(memoryview(self.offsets).cast('B'))
+            f.write(memoryview(self.hashes).cast('B'))
+            f.write(memoryview(self.table).cast('B'))
+            f.write(self.data)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """Load a saved pool; with use_mmap the buffers are mapped read-only instead of read"""
+        pool = cls.__new__(cls)
+        f = open(path, 'rb')
+        if use_mmap:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            pool._mmap, pool._file = buffer, f
+        else:
+            buffer = f.read()
+            f.close()
+            pool._mmap = pool._file = None
+        magic, n, capacity, data_size = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            pool.close()
+            raise ValueError(f"{path} is not a saved StringPool")
+        view = memoryview(buffer)
+        position = _HEADER.size
+        sections = []
+        for typecode, count in (('Q', n + 1), ('I', n), ('i', capacity)):
+            nbytes = array(typecode).itemsize * count
+            sections.append(view[position:position + nbytes].cast(typecode))
+            position += nbytes
+        pool.offsets, pool.hashes, pool.table = sections
+        pool.data = view[position:position + data_size]
+        if not use_mmap:
+            pool._make_writable()
+        return pool
+
+    def _make_writable(self):
+        """Copy memory-mapped buffers into private, growable ones"""
+        offsets, hashes, table = array('Q'), array('I'), array('i')
+        offsets.frombytes(self.offsets.cast('B'))
+        hashes.frombytes(self.hashes.cast('B'))
+        table.frombytes(self.table.cast('B'))
+        data = bytearray(self.data)
+        self.close()
+        self.offsets, self.hashes, self.table, self.data = offsets, hashes, table, data
+
+    def close(self):
+        """Release a memory-mapped file (the pool is unusable afterwards unless copied)"""
+        for view in (self.offsets, self.hashes, self.table, self.data):
+            if isinstance(view, memoryview):
+                view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._mmap = self._file = None
+
+    def __getstate__(self):
+        if isinstance(self.data, memoryview):
+            self._make_writable()
+        state = self.__dict__.copy()
+        state['_mmap'] = state['_file'] = None
+        return state
+
+# Process-wide pool used by q2.py, q3.py and Q8.py when no pool is passed in
+SHARED_POOL = StringPool()
+
+def main():
+    parser = argparse.ArgumentParser(description="StringPool memory and speed demo")
+    parser.add_argument("--words", type=int, default=1_000_000, help="tokens to intern")
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--save", help="save the pool here and reload it with mmap")
+    args = parser.parse_args()
+
+    from benchmarks import synthetic_words
+    words = synthetic_words(args.words, args.vocab, seed=0)
+
+    start = time.perf_counter()
+    pool = StringPool()
+    ids = pool.intern_many(words)
+    elapsed = time.perf_counter() - start
+    distinct = set(words)
+    set_bytes = sys.getsizeof(distinct) + sum(sys.getsizeof(w) for w in distinct)
+    list_bytes = sys.getsizeof(words)
+
+    print(f"Interned {len(words)} tokens ({len(pool)} distinct) in {elapsed:.2f}s")
+    print(f"String pool:        {pool.nbytes() / 1e6:8.2f} MB")
+    print(f"Python set of str:  {set_bytes / 1e6:8.2f} MB")
+    print(f"Token ids (uint32): {ids.itemsize * len(ids) / 1e6:8.2f} MB "
+          f"vs list of str references {list_bytes / 1e6:.2f} MB")
+    print(f"Round trip: {pool.strings(ids[:5])} == {words[:5]}")
+
+    if args.save:
+        pool.save(args.save)
+        mapped = StringPool.load(args.save)
+        assert all(mapped.get(w) == pool.get(w) for w in words[:1000])
+        print(f"Saved to {args.save} and memory-mapped back ({len(mapped)} strings)")
+        mapped.close()
+
+if __name__ == "__main__":
+    main()